@@ -1,14 +1,21 @@
 # ---------------------------------------------------------------------------------------------------------------------------------#
+import asyncio
 import logging
 import os
+import time
+from typing import Optional
 from fastapi import FastAPI, HTTPException, Security
 from fastapi.security.api_key import APIKeyHeader
+# NB : les modules importés ici sont légers, les dépendances lourdes
+# (langchain, faiss, pandas, SQLAlchemy...) sont chargées au premier usage.
 from src.rag_chain import rag_response
-from src.data_loader import load_csv
-from src.embedding import data_to_embeddings
-from utils.pydantic_utils import QueryRequest
-from src.openagenda_loader import fetch_openagenda_events, save_events_to_csv
-from utils.file_utils import delete_file, delete_folder
+from src.scheduler import scheduler, SchedulerRejection
+from src.priors import compute_event_priors, choose_ab_arm, record_served, ab_stats, ARM_PRIORS
+from src.vectorsearch import doc_events, parse_date_end
+from src.shards import AGENDA_UIDS, compact_shards, migrate_legacy_layout, get_shard_manager, shard_stats
+from src.query_encoder import query_encoder_stats
+from utils.pydantic_utils import QueryRequest, FeedbackRequest, MAX_SOURCE_IDS
+from utils.feedback_writer import feedback_writer, FeedbackQueueFull
 from dotenv import load_dotenv
 
 # -------------------------------------------------------------------
@@ -34,6 +41,8 @@ api_key_header = APIKeyHeader(name="X-API-Key")
 VECTORDB_PATH = os.getenv("VECTORDB_PATH", "vectorDB")
 DATA_DIR = os.getenv("DATA_DIR", "data")
 DATA_FILE = os.getenv("DATA_FILE", "events_raw")
+PRIORS_REFRESH_S = float(os.getenv("PRIORS_REFRESH_S", "3600"))
+COMPACT_INTERVAL_S = float(os.getenv("COMPACT_INTERVAL_S", "86400"))
 
 
 # -------------------------------------------------------------------
@@ -52,32 +61,88 @@ def _verify_api_chat(x_api_key: str = Security(api_key_header)):
     """Sécurité pour l'endpoint /chat (user ou admin)"""
     if x_api_key not in {API_KEY, API_KEY_ADMIN}:
         raise HTTPException(status_code=401, detail="Invalid API key")
+    return x_api_key
 
 
 def _verify_api_admin(api_key: str = Security(api_key_header)):
     '''pour la partie rebuild (admin)'''
     if api_key != API_KEY_ADMIN:
         raise HTTPException(status_code=403, detail = "Admin only")
+    return api_key
 
 
-def launch_the_rag():
+def launch_the_rag(force: bool = False, agenda_uids=None):
+    """Construit les shards manquants (ou tous si `force`) ; les autres seront chargés à la première requête."""
+    agenda_uids = agenda_uids or AGENDA_UIDS
+    migrate_legacy_layout(VECTORDB_PATH, DATA_DIR, DATA_FILE)
+    if not force and len(get_shard_manager(VECTORDB_PATH).available()) == len(AGENDA_UIDS):
+        logging.info(f"Shards existants dans {VECTORDB_PATH} : pas de reconstruction au démarrage")
+        return
     try:
-        logging.debug("Initialisation du système RAG au démarrage...")
-        data = load_csv(data_dir=DATA_DIR, data_name=DATA_FILE)
-        logging.info(f"{len(data)} lignes chargées depuis {DATA_FILE}.csv")
+        from src.pipeline import build_shards
 
-        data_to_embeddings(data, persist_dir=VECTORDB_PATH)
-        logging.info("Base vectorielle initialisée avec succès")
+        logging.debug("Initialisation du système RAG au démarrage...")
+        built = build_shards(DATA_DIR, DATA_FILE, VECTORDB_PATH, agenda_uids, force=force)
+        missing = [uid for uid in agenda_uids
+                   if uid not in built and (force or uid not in get_shard_manager(VECTORDB_PATH).available())]
+        if missing:
+            raise RuntimeError(f"shard(s) non construit(s) : {', '.join(missing)}")
     except Exception as e:
         logging.error(f"Erreur lors de l'initialisation du RAG : {e}")
         raise HTTPException(status_code=503, detail="Système RAG indisponible au démarrage")
 
 
+def source_events(results, limit: int = MAX_SOURCE_IDS):
+    """
+    Événements sources des chunks retournés, sans doublon, chacun avec ses propres métadonnées.
+    Un chunk partagé (pied de page commun...) ne recommande pas tous ses événements : seuls ceux
+    également retrouvés par un chunk qui leur est propre sont gardés (tous, faute de chunk propre),
+    sans dépasser `limit` (borne de FeedbackRequest.source_ids).
+    Les événements déjà terminés d'un chunk partagé ne sont pas proposés.
+    """
+    now = time.time()
+    chunks = [doc_events(doc.metadata) for doc in results]
+    specific = {str(event.get("id")) for chunk in chunks if len(chunk) == 1 for event in chunk}
+    events = {}
+    for chunk in chunks:
+        for event in chunk:
+            event_id = str(event.get("id"))
+            if len(chunk) > 1 and specific and event_id not in specific:
+                continue
+            if len(events) < limit and parse_date_end(event.get("date_end")) >= now:
+                events.setdefault(event_id, event)
+    return events
+
+
+async def run_periodically(func, interval: float, *args):
+    """Exécute func(*args) dans un thread toutes les `interval` secondes (priors, compaction...)."""
+    while True:
+        await asyncio.to_thread(func, *args)
+        await asyncio.sleep(interval)
+
+
 # -------------------------------------------------------------------
 # Événement de démarrage
 @app.on_event("startup")
 async def startup_event():
+    from utils.feedback_db import init_db
+
+    # création / migration du schéma feedback (jamais au simple import du module)
+    await asyncio.to_thread(init_db)
     launch_the_rag()
+    if PRIORS_REFRESH_S > 0:
+        app.state.priors_task = asyncio.create_task(
+            run_periodically(compute_event_priors, PRIORS_REFRESH_S, VECTORDB_PATH))
+    if COMPACT_INTERVAL_S > 0:
+        app.state.compact_task = asyncio.create_task(
+            run_periodically(compact_shards, COMPACT_INTERVAL_S, VECTORDB_PATH))
+
+
+# -------------------------------------------------------------------
+# Événement d'arrêt : on vide la file des feedbacks avant de quitter
+@app.on_event("shutdown")
+async def shutdown_event():
+    feedback_writer.stop()
 
 
 # -------------------------------------------------------------------
@@ -97,45 +162,110 @@ async def home():
 async def chat_endpoint(request: QueryRequest, api_key: str = Security(_verify_api_chat)):
     query = request.question
     model_choice = request.model_size
-    logging.debug(f"Nouvelle requête utilisateur (model:{model_choice}): {query}")
+    ab_arm = choose_ab_arm()
+    logging.debug(f"Nouvelle requête utilisateur (model:{model_choice}, ab:{ab_arm}): {query}")
     try:
-        llm_text, results = rag_response(query=query, persist_dir=VECTORDB_PATH, model_size=model_choice)
+        llm_text, results = await scheduler.submit(
+            model_choice, api_key, rag_response,
+            query=query, persist_dir=VECTORDB_PATH, model_size=model_choice,
+            use_priors=(ab_arm == ARM_PRIORS), near=request.near, agendas=request.agendas
+        )
         if not llm_text:
             raise HTTPException(status_code=503, detail="Système RAG indisponible")
 
         #structuré pour les sources
+        events = source_events(results)
         sources_text = "\n--- Sources ---\n" 
-        for doc in results: 
-            sources_text += f"- {doc.metadata.get('title')} ({doc.metadata.get('city')}, fin: {doc.metadata.get('date_end')})\n"
+        for event in events.values(): 
+            sources_text += f"- {event.get('title')} ({event.get('city')}, fin: {event.get('date_end')})\n"
+
+        # identifiants des événements sources (pour le feedback structuré)
+        source_ids = list(events)
 
-        return {"answer": llm_text, "sources": sources_text}
+        record_served(ab_arm)
+        return {"answer": llm_text, "sources": sources_text, "source_ids": source_ids, "ab_arm": ab_arm}
+    except SchedulerRejection as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Service saturé ({e.reason}), merci de réessayer plus tard",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except HTTPException as e:
         raise e
     except Exception as e:
         logging.error(f"Erreur lors du traitement de la requête : {e}")
         raise HTTPException(status_code=500, detail="Erreur interne lors du traitement")
 
+# -------------------------------------------------------------------
+# Endpoint feedback : mis en file, écrit par lots en arrière-plan
+@app.post("/feedback", status_code=202)
+async def feedback_endpoint(request: FeedbackRequest, api_key: str = Security(_verify_api_chat)):
+    value = 1 if request.feedback == "positive" else 0
+    try:
+        accepted = feedback_writer.enqueue(
+            question=request.question,
+            answer=request.answer,
+            sources=request.sources,
+            feedback_label=request.feedback,
+            value=value,
+            comment=request.comment,
+            model_size=request.model_size,
+            source_ids=request.source_ids,
+            ab_arm=request.ab_arm
+        )
+    except FeedbackQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Trop de feedbacks en attente, merci de réessayer plus tard",
+            headers={"Retry-After": "5"}
+        )
+    if not accepted:
+        raise HTTPException(status_code=422, detail="Feedback invalide")
+    return {"info": "Feedback enregistré, merci !"}
+
+# -------------------------------------------------------------------
+# Endpoint analytics : lecture des rollups pré-agrégés (admin)
+@app.get("/feedback/analytics")
+async def feedback_analytics(limit: int = 10, days: int = 30, api_key: str = Security(_verify_api_admin)):
+    try:
+        from utils import feedback_db
+        return feedback_db.get_feedback_analytics(limit=limit, days=days)
+    except Exception as e:
+        logging.error(f"Erreur lors du calcul des analytics : {e}")
+        raise HTTPException(status_code=500, detail="Erreur interne lors du calcul des analytics")
+
+# -------------------------------------------------------------------
+# Endpoint metrics : profondeur des files et temps d'attente (admin)
+@app.get("/metrics")
+async def metrics(api_key: str = Security(_verify_api_admin)):
+    return {
+        "scheduler": scheduler.stats(),
+        "feedback": feedback_writer.stats(),
+        "priors_ab": ab_stats(),
+        "query_encoder": query_encoder_stats(),
+        "shards": shard_stats()
+    }
+
 # -------------------------------------------------------------------
 # Endpoint rebuild
 @app.post("/rebuild")
-async def system_rebuild(api_key: str = Security(_verify_api_admin)):
-    logging.info("Reconstruction complète demandée.")
+async def system_rebuild(agenda: Optional[str] = None, api_key: str = Security(_verify_api_admin)):
+    """Reconstruit tous les shards, ou seulement celui de `agenda`."""
+    if agenda is not None and agenda not in AGENDA_UIDS:
+        raise HTTPException(status_code=404, detail=f"Agenda inconnu : {agenda}")
+    logging.info(f"Reconstruction demandée ({agenda or 'tous les agendas'}).")
 
     try:
-        # Récupération OpenAgenda
-        df = fetch_openagenda_events()
-        if df.empty:
-            raise HTTPException(status_code=500, detail="Aucune donnée récupérée depuis OpenAgenda")
+        from src.pipeline import fetch_events
 
-        # Suppression anciennes données
-        delete_file(f"{DATA_DIR}/{DATA_FILE}.csv")
-        delete_folder(VECTORDB_PATH)
-
-        # Sauvegarde nouvelles données
-        save_events_to_csv(df, DATA_DIR, DATA_FILE)
+        # Récupération OpenAgenda + sauvegarde (stockage colonnaire typé), agenda par agenda
+        agenda_uids = [uid for uid in ([agenda] if agenda else AGENDA_UIDS)
+                       if not fetch_events(DATA_DIR, DATA_FILE, uid).empty]
+        if not agenda_uids:
+            raise HTTPException(status_code=500, detail="Aucune donnée récupérée depuis OpenAgenda")
 
-        # Reconstruction vectorDB
-        launch_the_rag()
+        # Reconstruction des shards concernés (les autres restent servis tels quels) + priors
+        launch_the_rag(force=True, agenda_uids=agenda_uids)
 
         return {"info": "Le Système RAG a été rechargé avec succès !"}
 
@@ -144,6 +274,15 @@ async def system_rebuild(api_key: str = Security(_verify_api_admin)):
         raise HTTPException(status_code=500, detail="Erreur interne lors du rebuild")
 
 
+# -------------------------------------------------------------------
+# Endpoint compact : retire les événements passés de l'index (sans rebuild)
+@app.post("/compact")
+async def system_compact(api_key: str = Security(_verify_api_admin)):
+    logging.info("Compaction de l'index demandée.")
+    removed = await asyncio.to_thread(compact_shards, VECTORDB_PATH)
+    return {"info": f"{removed} vecteurs expirés supprimés de l'index"}
+
+
 # -------------------------------------------------------------------
 # Démarrage du serveur
 if __name__ == "__main__":
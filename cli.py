@@ -0,0 +1,184 @@
+# ---------------------------------------------------------------------------------------------------------------------------------#
+# CLI d'ingestion / indexation : réutilise src/ sans démarrer le serveur web
+#
+#   python cli.py fetch            -> récupère OpenAgenda et écrit data/<DATA_FILE>_<agenda>.parquet
+#   python cli.py build-index      -> reconstruit entièrement les shards FAISS (+ priors)
+#   python cli.py update           -> mise à jour incrémentale (seuls les événements ajoutés / modifiés sont ré-embarqués)
+#   python cli.py compact          -> retire des shards les événements terminés
+#   python cli.py shards           -> liste les shards (version, nombre d'événements, emprise)
+#   python cli.py priors           -> recalcule les priors issus du feedback
+#   python cli.py export-csv       -> exporte le stockage Parquet en CSV
+#   python cli.py benchmark        -> latence de recherche (et --imports : temps d'import de app.py)
+#
+# fetch, build-index, update et compact acceptent --agenda <uid> (par défaut : tous les AGENDA_UIDS)
+import argparse
+import logging
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from dotenv import load_dotenv
+
+# -------------------------------------------------------------------
+# Configuration externalisée (via .env), identique à app.py
+load_dotenv()
+VECTORDB_PATH = os.getenv("VECTORDB_PATH", "vectorDB")
+DATA_DIR = os.getenv("DATA_DIR", "data")
+DATA_FILE = os.getenv("DATA_FILE", "events_raw")
+
+BENCHMARK_QUERIES = [
+    "Des événements religieux sur Paris",
+    "Un concert de musique classique ce week-end",
+    "Une exposition pour les enfants",
+    "Des conférences sur l'histoire de l'art",
+    "Une visite guidée gratuite",
+]
+
+
+# -------------------------------------------------------------------
+# Commandes
+def _agendas(args):
+    from src.shards import AGENDA_UIDS
+    return [args.agenda] if args.agenda else AGENDA_UIDS
+
+
+def cmd_fetch(args):
+    from src.pipeline import fetch_events
+    empty = [uid for uid in _agendas(args) if fetch_events(DATA_DIR, DATA_FILE, uid).empty]
+    return 0 if not empty else 1
+
+
+def cmd_build_index(args):
+    from src.pipeline import build_shards
+    agenda_uids = _agendas(args)
+    built = build_shards(DATA_DIR, DATA_FILE, VECTORDB_PATH, agenda_uids, force=True)
+    return 0 if len(built) == len(agenda_uids) else 1
+
+
+def cmd_update(args):
+    from src.pipeline import incremental_update
+    status = 0
+    for agenda_uid in _agendas(args):
+        result = incremental_update(DATA_DIR, DATA_FILE, VECTORDB_PATH, agenda_uid)
+        if result is None:
+            status = 1
+        print(f"{agenda_uid} : {result}")
+    return status
+
+
+def cmd_compact(args):
+    from src.shards import compact_shards
+    print(f"{compact_shards(VECTORDB_PATH, [args.agenda] if args.agenda else None)} vecteurs expirés supprimés")
+    return 0
+
+
+def cmd_shards(args):
+    from src.shards import AGENDA_UIDS, shard_dir, read_manifest
+    for agenda_uid in AGENDA_UIDS:
+        manifest = read_manifest(shard_dir(VECTORDB_PATH, agenda_uid))
+        print(f"{agenda_uid} : version {manifest.get('version', '-')}, {manifest.get('events', '-')} événements, "
+              f"mis à jour {manifest.get('updated_at', '-')}, emprise {manifest.get('bbox')}")
+    return 0
+
+
+def cmd_priors(args):
+    from src.priors import compute_event_priors
+    print(f"{compute_event_priors(VECTORDB_PATH)} priors calculés")
+    return 0
+
+
+def cmd_export_csv(args):
+    from src.event_store import export_csv
+    from src.shards import AGENDA_UIDS, shard_data_file
+    for agenda_uid in AGENDA_UIDS:
+        print(export_csv(DATA_DIR, shard_data_file(DATA_FILE, agenda_uid)))
+    return 0
+
+
+def _import_profile(module: str, top: int):
+    """Lance `python -X importtime -c 'import module'` et résume les imports les plus coûteux."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if match:
+            rows.append((int(match.group(2)), len(match.group(3)), match.group(4)))
+    position = next((i for i, (_, _, name) in enumerate(rows) if name == module), None)
+    if position is None:
+        print(f"Import de {module} impossible :\n{result.stderr[-2000:]}")
+        return
+    total, indent, _ = rows[position]
+    print(f"import {module} : {total / 1000:.1f} ms")
+
+    # importtime affiche les sous-modules avant leur parent, avec une indentation plus profonde
+    children = []
+    for cumulative, child_indent, name in reversed(rows[:position]):
+        if child_indent <= indent:
+            break
+        if child_indent == indent + 2:
+            children.append((cumulative, name))
+    for cumulative, name in sorted(children, reverse=True)[:top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+
+def cmd_benchmark(args):
+    if args.imports:
+        _import_profile("app", args.top)
+
+    if args.queries:
+        from src.shards import search_shards as search
+
+        started = time.perf_counter()
+        search(BENCHMARK_QUERIES[0], VECTORDB_PATH)
+        print(f"Première recherche (chargement des shards inclus) : {1000 * (time.perf_counter() - started):.1f} ms")
+
+        latencies = []
+        for i in range(args.queries):
+            started = time.perf_counter()
+            search(BENCHMARK_QUERIES[i % len(BENCHMARK_QUERIES)], VECTORDB_PATH)
+            latencies.append(1000 * (time.perf_counter() - started))
+        latencies.sort()
+        print(f"{len(latencies)} recherches : p50 {statistics.median(latencies):.1f} ms, "
+              f"p95 {latencies[int(0.95 * (len(latencies) - 1))]:.1f} ms, max {latencies[-1]:.1f} ms")
+    return 0
+
+
+# -------------------------------------------------------------------
+# Point d'entrée
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Puls-Events AI : ingestion et indexation hors API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for name, help_text, func in [
+        ("fetch", "Récupère les événements OpenAgenda", cmd_fetch),
+        ("build-index", "Reconstruit les shards FAISS", cmd_build_index),
+        ("update", "Mise à jour incrémentale des shards", cmd_update),
+        ("compact", "Supprime les événements terminés des shards", cmd_compact),
+    ]:
+        command = subparsers.add_parser(name, help=help_text)
+        command.add_argument("--agenda", help="Limite la commande à un agenda (uid OpenAgenda)")
+        command.set_defaults(func=func)
+    subparsers.add_parser("shards", help="Liste les shards et leur version").set_defaults(func=cmd_shards)
+    subparsers.add_parser("priors", help="Recalcule les priors issus du feedback").set_defaults(func=cmd_priors)
+    subparsers.add_parser("export-csv", help="Exporte les événements en CSV").set_defaults(func=cmd_export_csv)
+
+    bench = subparsers.add_parser("benchmark", help="Mesure la latence de recherche et le temps d'import")
+    bench.add_argument("--queries", type=int, default=20, help="Nombre de recherches (0 pour ignorer)")
+    bench.add_argument("--imports", action="store_true", help="Profile le temps d'import de app.py")
+    bench.add_argument("--top", type=int, default=10, help="Nombre d'imports les plus lents affichés")
+    bench.set_defaults(func=cmd_benchmark)
+
+    args = parser.parse_args(argv)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    from src.shards import migrate_legacy_layout
+    migrate_legacy_layout(VECTORDB_PATH, DATA_DIR, DATA_FILE)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,33 +2,22 @@ import streamlit as st
 import requests
 import time
 import os
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
 from streamlit_feedback import streamlit_feedback
-from utils.feedback_db import Feedback, Base, save_feedback_to_db
 from dotenv import load_dotenv
 
 # -----------------------------------------------------------
-# --- CONFIGURATION DE LA PAGE & DB ---
+# --- CONFIGURATION DE LA PAGE ---
 st.set_page_config(
     page_title="Puls-Events AI",
     page_icon="🎉",
     layout="centered"
 )
 
-# Configuration de la base de données SQLite
-DB_PATH = "data/feedback.db"
-if not os.path.exists("data"):
-    os.makedirs("data")
-
-engine = create_engine(f"sqlite:///{DB_PATH}", connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(bind=engine)
-# Création des tables si elles n'existent pas
-Base.metadata.create_all(bind=engine)
-
 load_dotenv()
 # URL de ton API FastAPI
 URL_API = os.getenv('URL_API')
+# Le feedback passe par l'API (plus d'écriture directe dans la base SQLite)
+URL_FEEDBACK = os.getenv('URL_FEEDBACK', URL_API.rsplit('/chat', 1)[0] + '/feedback' if URL_API else None)
 CLE_API = os.getenv('API_KEY')
 MAX_HISTORY_LENGTH = 20
 
@@ -72,6 +61,28 @@ def stream_text(text):
         yield word + " "
         time.sleep(0.03)
 
+
+def send_feedback(question, answer, sources, feedback_label, comment=None, model_size=None, source_ids=None,
+                  ab_arm=None):
+    """Envoie le feedback à l'API. Retourne True si accepté."""
+    if feedback_label is None:
+        return False
+    payload = {
+        "question": question,
+        "answer": answer,
+        "sources": sources,
+        "feedback": feedback_label,
+        "comment": comment,
+        "model_size": model_size,
+        "source_ids": source_ids or [],
+        "ab_arm": ab_arm
+    }
+    try:
+        response = requests.post(URL_FEEDBACK, json=payload, headers={"X-API-Key": CLE_API}, timeout=10)
+        return response.status_code == 202
+    except Exception:
+        return False
+
 # ------------------------------------------------------------------------------------
 # --- SIDEBAR ---
 with st.sidebar:
@@ -127,6 +138,8 @@ if user_input:
             data = st.session_state.query_cache[user_input]
             answer = data["answer"]
             sources_text = data["sources"]
+            source_ids = data.get("source_ids", [])
+            ab_arm = data.get("ab_arm")
         else:
             # Appel API
             with st.spinner("Recherche des événements..."):
@@ -137,12 +150,14 @@ if user_input:
                         data = response.json()
                         answer = data.get("answer", "Désolé, je n'ai pas trouvé d'information.")
                         sources_text = data.get("sources", "")
+                        source_ids = data.get("source_ids", [])
+                        ab_arm = data.get("ab_arm")
                         # Mise en cache
                         st.session_state.query_cache[user_input] = data
                     else:
-                        answer, sources_text = "Erreur lors de la connexion à l'IA.", ""
+                        answer, sources_text, source_ids, ab_arm = "Erreur lors de la connexion à l'IA.", "", [], None
                 except Exception as e:
-                    answer, sources_text = f"Erreur technique : {e}", ""
+                    answer, sources_text, source_ids, ab_arm = f"Erreur technique : {e}", "", [], None
 
         # Affichage animé
         response_placeholder.write_stream(stream_text(answer))
@@ -160,6 +175,9 @@ if user_input:
             "question": user_input,
             "answer": answer,
             "sources": sources_text,
+            "source_ids": source_ids,
+            "model_size": current_model_size,
+            "ab_arm": ab_arm,
             "id": st.session_state.interaction_id
         }
         
@@ -196,20 +214,22 @@ if st.session_state.messages and st.session_state.messages[-1]["role"] == "assis
         score_val = fb.get("score")
         comment = fb.get('text', None)
         if score_val in ["👍", "thumbs_up", "up"]:
-            label, value = 'positive', 1
+            label = 'positive'
         elif score_val in ["👎", "thumbs_down", "down"]:
-            label, value = 'negative', 0
+            label = 'negative'
         else:
-            label, value = None, None
+            label = None
         
-        # Enregistrement
-        success = save_feedback_to_db(
+        # Enregistrement (via l'API)
+        success = send_feedback(
             question=last_res["question"],
             answer=last_res["answer"],
             sources=last_res["sources"],
             feedback_label=label,
-            value=value,
-            comment=comment
+            comment=comment,
+            model_size=last_res["model_size"],
+            source_ids=last_res["source_ids"],
+            ab_arm=last_res["ab_arm"]
         )
         
         if success:
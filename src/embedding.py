@@ -1,12 +1,24 @@
+from __future__ import annotations
+
 import os
+import hashlib
 import logging
-import pandas as pd
+import multiprocessing
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Any
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_core.documents import Document
+from typing import TYPE_CHECKING, List, Any, Dict, Iterable
+from src.vectorsearch import get_embeddings, event_info, doc_events, set_events, merge_events
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from langchain_core.documents import Document
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# au-delà de ce nombre de documents, le découpage est réparti sur plusieurs processus
+PARALLEL_CHUNKING_MIN_DOCS = int(os.getenv("PARALLEL_CHUNKING_MIN_DOCS", "5000"))
+CHUNKING_WORKERS = int(os.getenv("CHUNKING_WORKERS", str(os.cpu_count() or 1)))
 
 # Configuration du logger
 logging.basicConfig(
@@ -17,8 +29,19 @@ logging.basicConfig(
     ]
 )
 
+def _coordinate(value):
+    # None plutôt que NaN pour les événements sans coordonnées
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if value != value else value
+
+
 def transform_csv_to_document(df: pd.DataFrame) -> List[Any]:
     try:
+        from langchain_core.documents import Document
+
         documents = []
         for _, row in df.iterrows():
             doc = Document(
@@ -27,7 +50,9 @@ def transform_csv_to_document(df: pd.DataFrame) -> List[Any]:
                     'id': row['id'],
                     'title': row['title'],
                     'city': row['city'],
-                    'date_end': row['date_end']
+                    'date_end': row['date_end'].isoformat() if hasattr(row['date_end'], 'isoformat') else row['date_end'],
+                    'latitude': _coordinate(row.get('latitude')),
+                    'longitude': _coordinate(row.get('longitude'))
                 }
             )
             documents.append(doc)
@@ -37,25 +62,160 @@ def transform_csv_to_document(df: pd.DataFrame) -> List[Any]:
         logging.error(f"Erreur lors de la transformation CSV → Document : {e}")
         return []
 
+@lru_cache(maxsize=8)
+def get_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    """Splitter réutilisé d'un appel à l'autre (un par couple de paramètres)."""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def _split_batch(documents: List[Document], chunk_size: int, chunk_overlap: int) -> List[Document]:
+    # fonction de module : exécutée dans les processus du pool
+    return get_splitter(chunk_size, chunk_overlap).split_documents(documents)
+
+
+def split_documents(documents: List[Document], chunk_size: int, chunk_overlap: int,
+                    workers: int = CHUNKING_WORKERS) -> List[Document]:
+    """Découpe les documents, en parallèle sur plusieurs cœurs pour les gros corpus."""
+    if workers <= 1 or len(documents) < PARALLEL_CHUNKING_MIN_DOCS:
+        return _split_batch(documents, chunk_size, chunk_overlap)
+
+    batch_size = -(-len(documents) // workers)
+    batches = [documents[i:i + batch_size] for i in range(0, len(documents), batch_size)]
+    logging.info(f"Découpage parallèle : {len(batches)} lots sur {workers} processus")
+    # spawn et non fork : l'API est multi-threadée (écriture des feedbacks, recherche, torch)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        results = pool.map(_split_batch, batches, [chunk_size] * len(batches), [chunk_overlap] * len(batches))
+        return [chunk for batch in results for chunk in batch]
+
+
+def _chunk_key(chunk: Document) -> str:
+    return hashlib.sha1(chunk.page_content.encode("utf-8")).hexdigest()
+
+
+def _merge_chunk(kept: Document, chunk: Document):
+    """Rattache les événements de `chunk` au chunk identique déjà conservé."""
+    set_events(kept.metadata, merge_events(doc_events(kept.metadata), doc_events(chunk.metadata)))
+
+
+def dedup_chunks(chunks: List[Document]) -> List[Document]:
+    """
+    Supprime les chunks au texte identique (pieds de page OpenAgenda répétés...).
+    Le chunk conservé garde, pour chacun de ses événements sources, ses propres
+    titre, ville, date de fin et coordonnées (`events`).
+    """
+    unique: Dict[str, Document] = {}
+    for chunk in chunks:
+        key = _chunk_key(chunk)
+        kept = unique.get(key)
+        if kept is None:
+            set_events(chunk.metadata, [event_info(chunk.metadata)])
+            unique[key] = chunk
+        else:
+            _merge_chunk(kept, chunk)
+    return list(unique.values())
+
+
+def chunk_stats(chunks: List[Document]) -> Dict[str, Any]:
+    """Distribution du nombre et de la taille (caractères) des chunks."""
+    sizes = sorted(len(chunk.page_content) for chunk in chunks)
+    if not sizes:
+        return {"count": 0}
+    per_event: Dict[Any, int] = {}
+    for chunk in chunks:
+        for event_id in chunk.metadata.get("event_ids", [chunk.metadata.get("id")]):
+            per_event[event_id] = per_event.get(event_id, 0) + 1
+    return {
+        "count": len(sizes),
+        "size_min": sizes[0],
+        "size_median": statistics.median(sizes),
+        "size_mean": round(statistics.fmean(sizes), 1),
+        "size_p95": sizes[int(0.95 * (len(sizes) - 1))],
+        "size_max": sizes[-1],
+        "total_chars": sum(sizes),
+        "chunks_per_event_max": max(per_event.values()),
+        "chunks_per_event_mean": round(statistics.fmean(per_event.values()), 2),
+    }
+
+
 def documents_to_chunks(df: pd.DataFrame, chunk_size: int, chunk_overlap: int) -> List[Any]:
     try:
         documents = transform_csv_to_document(df)
-        splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-        chunks = splitter.split_documents(documents)
-        logging.info(f"{len(chunks)} chunks générés avec succès")
-        return chunks
+        chunks = split_documents(documents, chunk_size, chunk_overlap)
+        unique_chunks = dedup_chunks(chunks)
+        logging.info(f"{len(unique_chunks)} chunks générés avec succès "
+                     f"({len(chunks) - len(unique_chunks)} doublons supprimés)")
+        logging.info(f"Distribution des chunks : {chunk_stats(unique_chunks)}")
+        return unique_chunks
     except Exception as e:
         logging.error(f"Erreur lors du découpage des documents : {e}")
         return []
 
 def data_to_embeddings(df: pd.DataFrame, persist_dir: str, chunk_size: int = 800, chunk_overlap: int = 120):
+    """Construit et sauvegarde l'index FAISS. Retourne le nombre de chunks indexés, ou None en cas d'échec."""
     try:
+        from langchain_community.vectorstores import FAISS
+
         chunks = documents_to_chunks(df, chunk_size, chunk_overlap)
+        if not chunks:
+            logging.error("Aucun chunk à indexer : base FAISS non générée")
+            return None
         logging.info(f"Génération des embeddings pour {len(chunks)} chunks...")
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+        embeddings = get_embeddings()
         os.makedirs(persist_dir, exist_ok=True)
         db = FAISS.from_documents(chunks, embeddings)
         db.save_local(persist_dir)
         logging.info(f"Base FAISS sauvegardée dans {persist_dir}")
+        return len(chunks)
     except Exception as e:
         logging.error(f"Erreur lors de la génération des embeddings : {e}")
+        return None
+
+
+def update_embeddings(df: pd.DataFrame, removed_ids: Iterable[Any], persist_dir: str,
+                      chunk_size: int = 800, chunk_overlap: int = 120):
+    """
+    Mise à jour incrémentale de l'index : retire les chunks des événements supprimés
+    ou modifiés, puis n'embarque que les chunks des événements de `df` (ajoutés / modifiés).
+    Retourne {"deleted": n, "added": n} ou None en cas d'erreur.
+    """
+    from src.vectorsearch import load_vectorDB, invalidate_cache
+
+    try:
+        db = load_vectorDB(persist_dir)
+        if not db:
+            return None
+
+        stale = {str(event_id) for event_id in removed_ids} | {str(event_id) for event_id in df["id"]}
+        to_delete, existing = [], {}
+        for docstore_id in db.index_to_docstore_id.values():
+            doc = db.docstore.search(docstore_id)
+            events = [event for event in doc_events(doc.metadata) if str(event["id"]) not in stale]
+            if not events:
+                to_delete.append(docstore_id)
+                continue
+            # toutes les métadonnées par événement sont recalculées à partir des survivants
+            set_events(doc.metadata, events)
+            existing[_chunk_key(doc)] = doc
+
+        if to_delete:
+            db.delete(to_delete)
+
+        new_chunks = []
+        for chunk in (documents_to_chunks(df, chunk_size, chunk_overlap) if not df.empty else []):
+            kept = existing.get(_chunk_key(chunk))
+            if kept is None:
+                new_chunks.append(chunk)
+            else:
+                _merge_chunk(kept, chunk)
+        if new_chunks:
+            db.add_documents(new_chunks)
+
+        db.save_local(persist_dir)
+        invalidate_cache(persist_dir)
+        logging.info(f"Index mis à jour : {len(to_delete)} chunks retirés, {len(new_chunks)} ajoutés")
+        return {"deleted": len(to_delete), "added": len(new_chunks)}
+    except Exception as e:
+        logging.error(f"Erreur lors de la mise à jour incrémentale de l'index : {e}")
+        return None
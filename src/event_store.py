@@ -0,0 +1,106 @@
+# src/event_store.py
+
+import os
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+import pandas as pd
+
+# Configuration du logger
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    handlers=[
+        logging.StreamHandler()
+    ]
+)
+
+# Schéma typé du stockage colonnaire (Parquet)
+SCHEMA = {
+    "id": "int64",
+    "title": "string",
+    "description": "string",
+    "date_end": "datetime64[ns, UTC]",
+    "city": "category",
+    "latitude": "float64",
+    "longitude": "float64",
+    "text_for_rag": "string",
+}
+
+# colonnes comparées pour détecter un événement modifié
+DIFF_COLUMNS = ["title", "date_end", "city", "latitude", "longitude", "text_for_rag"]
+
+
+def _parquet_path(data_dir: str, data_file: str) -> Path:
+    return Path(data_dir) / f"{data_file}.parquet"
+
+
+def normalize_events(df: pd.DataFrame) -> pd.DataFrame:
+    """Applique le schéma (dates parsées, ville catégorielle) et trie par id."""
+    df = df.copy()
+    for column in SCHEMA:
+        if column not in df.columns:
+            df[column] = None
+    df["date_end"] = pd.to_datetime(df["date_end"], utc=True, errors="coerce", format="ISO8601")
+    df = df.astype({column: dtype for column, dtype in SCHEMA.items() if column != "date_end"})
+    extra = [column for column in df.columns if column not in SCHEMA]
+    df = df[list(SCHEMA) + extra]
+    df = df.drop_duplicates(subset=["id"], keep="last")
+    return df.sort_values("id", kind="stable").reset_index(drop=True)
+
+
+def save_events(df: pd.DataFrame, data_dir: str, data_file: str) -> Path:
+    os.makedirs(data_dir, exist_ok=True)
+    path = _parquet_path(data_dir, data_file)
+    normalize_events(df).to_parquet(path, index=False)
+    logging.info(f"{len(df)} événements sauvegardés dans {path}")
+    return path
+
+
+def load_events(data_dir: str, data_file: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Lit le stockage Parquet (uniquement les colonnes demandées).
+    Si seul l'ancien CSV existe, il est converti une fois pour toutes.
+    """
+    try:
+        path = _parquet_path(data_dir, data_file)
+        csv_path = Path(data_dir) / f"{data_file}.csv"
+        if not path.exists() and csv_path.exists():
+            logging.info(f"Migration de {csv_path} vers {path}")
+            save_events(pd.read_csv(csv_path), data_dir, data_file)
+
+        df = pd.read_parquet(path, columns=columns)
+        logging.info(f"✓ {df.shape[0]} événements et {df.shape[1]} colonnes chargés depuis {path}")
+        return df
+    except Exception as e:
+        logging.error(f"Erreur lors du chargement des événements : {e}")
+        return pd.DataFrame(columns=columns or list(SCHEMA))
+
+
+def append_events(df: pd.DataFrame, data_dir: str, data_file: str) -> Path:
+    """Ajoute (ou remplace, à id égal) des événements dans le stockage existant."""
+    existing = load_events(data_dir, data_file) if _parquet_path(data_dir, data_file).exists() else None
+    merged = df if existing is None or existing.empty else pd.concat(
+        [existing, normalize_events(df)], ignore_index=True)
+    return save_events(merged, data_dir, data_file)
+
+
+def diff_events(old: pd.DataFrame, new: pd.DataFrame) -> Dict[str, List[int]]:
+    """Ids ajoutés, supprimés et modifiés entre deux versions du stockage."""
+    old = normalize_events(old).set_index("id")
+    new = normalize_events(new).set_index("id")
+    added = new.index.difference(old.index)
+    removed = old.index.difference(new.index)
+    common = new.index.intersection(old.index)
+    old_hash = pd.util.hash_pandas_object(old.loc[common, DIFF_COLUMNS].astype(str), index=False)
+    new_hash = pd.util.hash_pandas_object(new.loc[common, DIFF_COLUMNS].astype(str), index=False)
+    changed = common[old_hash.to_numpy() != new_hash.to_numpy()]
+    return {"added": added.tolist(), "removed": removed.tolist(), "changed": changed.tolist()}
+
+
+def export_csv(data_dir: str, data_file: str) -> Path:
+    """Export CSV (format d'échange uniquement, le stockage de référence reste Parquet)."""
+    csv_path = Path(data_dir) / f"{data_file}.csv"
+    load_events(data_dir, data_file).to_csv(csv_path, index=False)
+    logging.info(f"Export CSV écrit dans {csv_path}")
+    return csv_path
@@ -0,0 +1,139 @@
+import logging
+import math
+import os
+from pathlib import Path
+import numpy as np
+from utils.file_utils import atomic_write
+
+# Configuration du logger
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    handlers=[
+        logging.StreamHandler()
+    ]
+)
+
+# taille d'une cellule de la grille, en degrés (~2 km en latitude)
+GEO_CELL_DEG = float(os.getenv("GEO_CELL_DEG", "0.02"))
+GEO_FILE = "geo.npz"
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Distance (km) entre un point et un tableau de points."""
+    lat, lon, lats, lons = map(np.radians, (lat, lon, lats, lons))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class GeoIndex:
+    """
+    Grille régulière lat/lon sur les positions de l'index FAISS.
+    Un chunk partagé par plusieurs événements est enregistré une fois par événement (un point chacun).
+    Les points sont triés par cellule (format CSR : `offsets` délimite chaque cellule),
+    une requête ne parcourt que les cellules qui recouvrent le cercle demandé.
+    """
+
+    def __init__(self, lat, lon, positions, cell_rows, cell_cols, offsets, cell_deg, size):
+        self.lat = lat                  # coordonnées de chaque point, triés par cellule
+        self.lon = lon
+        self.positions = positions      # position FAISS de chaque point
+        self.cell_rows = cell_rows
+        self.cell_cols = cell_cols
+        self.offsets = offsets
+        self.cell_deg = cell_deg
+        self.size = size                # nombre de positions de l'index FAISS couvert
+
+    @classmethod
+    def from_points(cls, lat, lon, positions, size: int, cell_deg: float = GEO_CELL_DEG):
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        positions = np.asarray(positions, dtype=np.int64)
+        located = ~np.isnan(lat) & ~np.isnan(lon)
+        lat, lon, positions = lat[located], lon[located], positions[located]
+        rows = np.floor(lat / cell_deg).astype(np.int64)
+        cols = np.floor(lon / cell_deg).astype(np.int64)
+
+        order = np.lexsort((cols, rows))
+        lat, lon, positions, rows, cols = lat[order], lon[order], positions[order], rows[order], cols[order]
+        starts = np.flatnonzero(np.r_[True, (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])]) \
+            if len(positions) else np.array([], dtype=np.int64)
+        offsets = np.r_[starts, len(positions)].astype(np.int64)
+        return cls(lat, lon, positions, rows[starts], cols[starts], offsets, cell_deg, int(size))
+
+    @classmethod
+    def from_coordinates(cls, lat, lon, cell_deg: float = GEO_CELL_DEG):
+        """Un point (éventuellement NaN) par position FAISS."""
+        return cls.from_points(lat, lon, np.arange(len(lat)), len(lat), cell_deg)
+
+    @classmethod
+    def from_vectorstore(cls, db, cell_deg: float = GEO_CELL_DEG):
+        from src.vectorsearch import doc_events
+
+        lat, lon, positions = [], [], []
+        for position, docstore_id in db.index_to_docstore_id.items():
+            metadata = getattr(db.docstore.search(docstore_id), "metadata", {})
+            for event in doc_events(metadata):
+                lat.append(_as_float(event.get("latitude")))
+                lon.append(_as_float(event.get("longitude")))
+                positions.append(position)
+        return cls.from_points(lat, lon, positions, db.index.ntotal, cell_deg)
+
+    def save(self, persist_dir: str):
+        with atomic_write(Path(persist_dir) / GEO_FILE) as f:
+            np.savez(f, lat=self.lat, lon=self.lon, positions=self.positions,
+                     cell_rows=self.cell_rows, cell_cols=self.cell_cols, offsets=self.offsets,
+                     cell_deg=np.float64(self.cell_deg), size=np.int64(self.size))
+
+    @classmethod
+    def load(cls, persist_dir: str):
+        with np.load(Path(persist_dir) / GEO_FILE) as data:
+            return cls(data["lat"], data["lon"], data["positions"], data["cell_rows"],
+                       data["cell_cols"], data["offsets"], float(data["cell_deg"]), int(data["size"]))
+
+    def query(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Positions FAISS (sans doublon) ayant au moins un point à moins de `radius_km` du point."""
+        if len(self.positions) == 0:
+            return np.array([], dtype=np.int64)
+        dlat = radius_km / 111.32
+        dlon = radius_km / (111.32 * max(math.cos(math.radians(lat)), 1e-6))
+        row_min, row_max = math.floor((lat - dlat) / self.cell_deg), math.floor((lat + dlat) / self.cell_deg)
+        col_min, col_max = math.floor((lon - dlon) / self.cell_deg), math.floor((lon + dlon) / self.cell_deg)
+
+        cells = np.flatnonzero((self.cell_rows >= row_min) & (self.cell_rows <= row_max)
+                               & (self.cell_cols >= col_min) & (self.cell_cols <= col_max))
+        if len(cells) == 0:
+            return np.array([], dtype=np.int64)
+        points = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in cells])
+        distances = haversine_km(lat, lon, self.lat[points], self.lon[points])
+        return np.unique(self.positions[points[distances <= radius_km]])
+
+
+def _as_float(value) -> float:
+    try:
+        return float(value) if value is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def load_or_build_geo_index(db, persist_dir: str) -> GeoIndex:
+    """Charge geo.npz s'il correspond à l'index FAISS courant, sinon le reconstruit et le sauvegarde."""
+    path = Path(persist_dir) / GEO_FILE
+    index_path = Path(persist_dir) / "index.faiss"
+    try:
+        if path.exists() and path.stat().st_mtime >= index_path.stat().st_mtime:
+            geo = GeoIndex.load(persist_dir)
+            if geo.size == db.index.ntotal:
+                return geo
+    except Exception as e:
+        logging.warning(f"Index géographique illisible, reconstruction : {e}")
+
+    geo = GeoIndex.from_vectorstore(db)
+    try:
+        geo.save(persist_dir)
+    except OSError as e:
+        logging.warning(f"Impossible de sauvegarder l'index géographique : {e}")
+    logging.info(f"Index géographique : {len(np.unique(geo.positions))}/{geo.size} chunks géolocalisés "
+                 f"({len(geo.positions)} points), {len(geo.cell_rows)} cellules")
+    return geo
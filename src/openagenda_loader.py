@@ -14,7 +14,7 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 API_KEY_AGENDA = os.getenv("OPENAGENDA_API_KEY")
 AGENDA_UID = os.getenv("OPENAGENDA_UID", "82290100")
 
-BASE_URL = f"https://api.openagenda.com/v2/agendas/{AGENDA_UID}/events"
+BASE_URL = "https://api.openagenda.com/v2/agendas/{agenda_uid}/events"
 
 LATITUDE = 48.8566
 LONGITUDE = 2.3522
@@ -24,9 +24,9 @@ DATE_START = (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d")
 DATE_END = (datetime.now() + timedelta(days=365)).strftime("%Y-%m-%d")
 
 
-def fetch_openagenda_events():
-    """Récupère et nettoie les événements OpenAgenda, sans logs verbeux."""
-    logging.info(f"Collecte des événements depuis OpenAgenda (agenda {AGENDA_UID})...")
+def fetch_openagenda_events(agenda_uid: str = AGENDA_UID):
+    """Récupère et nettoie les événements d'un agenda OpenAgenda, sans logs verbeux."""
+    logging.info(f"Collecte des événements depuis OpenAgenda (agenda {agenda_uid})...")
 
     events_data = []
     offset = 0
@@ -44,7 +44,7 @@ def fetch_openagenda_events():
                 "offset": offset
             }
 
-            response = requests.get(BASE_URL, params=params)
+            response = requests.get(BASE_URL.format(agenda_uid=agenda_uid), params=params)
             response.raise_for_status()
             data = response.json()
 
@@ -66,8 +66,11 @@ def fetch_openagenda_events():
                     "id": event.get("uid"),
                     "title": title,
                     "description": description,
-                    "date_end": timings[0].get("end") if timings else None,
+                    # fin de la dernière occurrence : l'événement expire après celle-ci
+                    "date_end": timings[-1].get("end") if timings else None,
                     "city": location.get("city"),
+                    "latitude": location.get("latitude"),
+                    "longitude": location.get("longitude"),
                     "text_for_rag": (
                         f"Titre: {title}. Description: {description}. "
                         f"Ville: {location.get('city')}"
@@ -99,6 +102,7 @@ def fetch_openagenda_events():
 
 
 def save_events_to_csv(df, data_dir, data_file):
+    """Export CSV uniquement : le stockage de référence est src/event_store.py (Parquet)."""
     os.makedirs(data_dir, exist_ok=True)
     csv_path = os.path.join(data_dir, f"{data_file}.csv")
     df.to_csv(csv_path, index=False)
@@ -0,0 +1,93 @@
+import logging
+import os
+from pathlib import Path
+from typing import List, Optional
+from src.event_store import load_events, save_events, diff_events
+from src.embedding import data_to_embeddings, update_embeddings
+from src.openagenda_loader import fetch_openagenda_events
+from src.priors import compute_event_priors
+from src.shards import AGENDA_UIDS, shard_dir, shard_data_file, write_manifest
+
+# Configuration du logger
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    handlers=[
+        logging.StreamHandler()
+    ]
+)
+
+# -------------------------------------------------------------------
+# Étapes d'ingestion / indexation partagées par l'API (app.py) et la CLI (cli.py)
+# Chaque agenda a son propre stockage (<DATA_FILE>_<agenda>.parquet) et son propre shard d'index.
+
+def fetch_events(data_dir: str, data_file: str, agenda_uid: str):
+    """Récupère les événements d'un agenda et remplace son stockage Parquet. Retourne le DataFrame."""
+    df = fetch_openagenda_events(agenda_uid)
+    if df.empty:
+        logging.warning(f"Aucune donnée récupérée depuis OpenAgenda (agenda {agenda_uid}), stockage inchangé")
+        return df
+    save_events(df, data_dir, shard_data_file(data_file, agenda_uid))
+    return df
+
+
+def build_index(data_dir: str, data_file: str, root: str, agenda_uid: str) -> Optional[int]:
+    """
+    Reconstruit entièrement le shard d'un agenda depuis son stockage. Retourne le nombre d'événements,
+    ou None si l'index n'a pas pu être écrit (manifest inchangé, l'index précédent reste servi).
+    """
+    name = shard_data_file(data_file, agenda_uid)
+    data = load_events(data_dir=data_dir, data_file=name)
+    logging.info(f"{len(data)} lignes chargées depuis {name}.parquet")
+    persist_dir = shard_dir(root, agenda_uid)
+    if data.empty or not data_to_embeddings(data, persist_dir=persist_dir) \
+            or not (Path(persist_dir) / "index.faiss").exists():
+        logging.error(f"Échec de la construction du shard {agenda_uid}")
+        return None
+    manifest = write_manifest(persist_dir, agenda_uid, events=data)
+    logging.info(f"Shard {agenda_uid} initialisé avec succès (version {manifest['version']})")
+    return len(data)
+
+
+def build_shards(data_dir: str, data_file: str, root: str, agenda_uids: Optional[List[str]] = None,
+                 force: bool = False) -> List[str]:
+    """
+    Construit les shards manquants (tous si `force`), puis les priors.
+    Retourne les agendas effectivement construits (ceux en échec n'y figurent pas).
+    """
+    built = []
+    for agenda_uid in agenda_uids or AGENDA_UIDS:
+        if not force and os.path.exists(os.path.join(shard_dir(root, agenda_uid), "index.faiss")):
+            continue
+        if build_index(data_dir, data_file, root, agenda_uid) is not None:
+            built.append(agenda_uid)
+    if built:
+        compute_event_priors(root)
+    return built
+
+
+def incremental_update(data_dir: str, data_file: str, root: str, agenda_uid: str):
+    """
+    Récupère l'agenda, compare au stockage actuel et ne ré-embarque que les événements
+    ajoutés ou modifiés (les supprimés sont retirés du shard). Retourne le diff, ou None.
+    """
+    name = shard_data_file(data_file, agenda_uid)
+    old = load_events(data_dir=data_dir, data_file=name)
+    new = fetch_openagenda_events(agenda_uid)
+    if new.empty:
+        logging.warning(f"Aucune donnée récupérée depuis OpenAgenda (agenda {agenda_uid}), mise à jour annulée")
+        return None
+
+    diff = diff_events(old, new)
+    logging.info(f"Diff ({agenda_uid}) : {len(diff['added'])} ajoutés, {len(diff['changed'])} modifiés, "
+                 f"{len(diff['removed'])} supprimés")
+
+    upserts = new[new["id"].isin(diff["added"] + diff["changed"])]
+    stats = update_embeddings(upserts, diff["removed"], shard_dir(root, agenda_uid))
+    if stats is None:
+        return None
+    save_events(new, data_dir, name)
+    manifest = write_manifest(shard_dir(root, agenda_uid), agenda_uid, events=new)
+    # événements ajoutés / modifiés / supprimés, puis chunks ajoutés / retirés de l'index
+    return {**{key: len(ids) for key, ids in diff.items()},
+            **{f"chunks_{key}": count for key, count in stats.items()}, "version": manifest["version"]}
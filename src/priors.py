@@ -0,0 +1,132 @@
+import logging
+import os
+import random
+import threading
+from pathlib import Path
+from utils.file_utils import atomic_write
+
+# Configuration du logger
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    handlers=[
+        logging.StreamHandler()
+    ]
+)
+
+# -------------------------------------------------------------------
+# Configuration externalisée (via .env)
+PRIOR_WEIGHT = float(os.getenv("PRIOR_WEIGHT", "0.1"))          # poids du prior dans le score final
+PRIOR_SMOOTHING = float(os.getenv("PRIOR_SMOOTHING", "5"))      # pseudo-votes (lissage bayésien)
+PRIOR_AB_RATIO = float(os.getenv("PRIOR_AB_RATIO", "0.5"))      # part du trafic avec priors
+PRIORS_FILE = "priors.npz"
+
+ARM_CONTROL = "control"
+ARM_PRIORS = "priors"
+
+_cache = {}
+_cache_lock = threading.Lock()
+_served = {ARM_CONTROL: 0, ARM_PRIORS: 0}
+
+
+# -------------------------------------------------------------------
+# Calcul périodique (hors chemin critique)
+def compute_event_priors(persist_dir: str, smoothing: float = PRIOR_SMOOTHING):
+    """
+    Calcule un prior par événement à partir des rollups de feedback :
+    satisfaction lissée vers la moyenne globale, centrée (0 = neutre, >0 = apprécié).
+    Le résultat est sauvegardé à côté de l'index FAISS (priors.npz).
+    """
+    try:
+        import numpy as np
+        from utils.feedback_db import SessionLocal, FeedbackEventRollup, init_db
+
+        init_db()
+        db = SessionLocal()
+        try:
+            rows = db.query(FeedbackEventRollup.event_id,
+                            FeedbackEventRollup.positive,
+                            FeedbackEventRollup.negative).all()
+        finally:
+            db.close()
+
+        event_ids = np.array([r.event_id for r in rows], dtype=str)
+        positive = np.array([r.positive for r in rows], dtype=np.float32)
+        negative = np.array([r.negative for r in rows], dtype=np.float32)
+
+        total = positive + negative
+        mean = positive.sum() / total.sum() if total.sum() else 0.5
+        prior = (positive + smoothing * mean) / (total + smoothing) - mean
+
+        os.makedirs(persist_dir, exist_ok=True)
+        path = Path(persist_dir) / PRIORS_FILE
+        # écriture atomique : la recherche peut relire le fichier à tout moment
+        with atomic_write(path) as f:
+            np.savez(f, event_ids=event_ids, prior=prior.astype(np.float32))
+        logging.info(f"Priors calculés pour {len(event_ids)} événements -> {path}")
+        return len(event_ids)
+    except Exception as e:
+        logging.error(f"Erreur lors du calcul des priors : {e}")
+        return 0
+
+
+# -------------------------------------------------------------------
+# Lecture (mise en cache mémoire, rechargée seulement si le fichier change)
+def load_event_priors(persist_dir: str):
+    """
+    Retourne {event_id: prior} ; {} si aucun prior n'a encore été calculé.
+    Un fichier illisible ne fait pas échouer la recherche : on garde les priors précédents (ou aucun).
+    """
+    path = Path(persist_dir) / PRIORS_FILE
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return {}
+
+    with _cache_lock:
+        cached = _cache.get(persist_dir)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        import numpy as np
+        try:
+            with np.load(path) as data:
+                priors = dict(zip(data["event_ids"].tolist(), data["prior"].tolist()))
+        except Exception as e:
+            logging.warning(f"Priors illisibles ({path}), recherche sans nouveaux priors : {e}")
+            return cached[1] if cached else {}
+        _cache[persist_dir] = (mtime, priors)
+        logging.debug(f"{len(priors)} priors chargés depuis {path}")
+        return priors
+
+
+def _doc_prior(doc, priors: dict) -> float:
+    # un chunk dédoublonné peut provenir de plusieurs événements : on garde le meilleur prior
+    event_ids = doc.metadata.get("event_ids") or [doc.metadata.get("id")]
+    return max(priors.get(str(event_id), 0.0) for event_id in event_ids)
+
+
+def apply_priors(scored_docs, priors: dict, weight: float = PRIOR_WEIGHT):
+    """Re-classe [(doc, relevance)] avec relevance + weight * prior(événement)."""
+    rescored = [(doc, score + weight * _doc_prior(doc, priors)) for doc, score in scored_docs]
+    return sorted(rescored, key=lambda item: item[1], reverse=True)
+
+
+# -------------------------------------------------------------------
+# A/B : une partie du trafic sert de groupe témoin (sans priors)
+def choose_ab_arm(ratio: float = PRIOR_AB_RATIO) -> str:
+    return ARM_PRIORS if random.random() < ratio else ARM_CONTROL
+
+
+def record_served(arm: str):
+    """
+    Compte une réponse /chat réussie (les requêtes refusées ou en erreur ne comptent pas).
+    Le compteur est aussi persisté à côté des rollups par groupe (taux de feedback par groupe).
+    """
+    from utils.feedback_writer import feedback_writer
+
+    _served[arm] += 1
+    feedback_writer.record_served(arm)
+
+
+def ab_stats():
+    return {"served": dict(_served), "weight": PRIOR_WEIGHT, "ratio": PRIOR_AB_RATIO}
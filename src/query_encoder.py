@@ -0,0 +1,139 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List
+
+# Configuration du logger
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    handlers=[
+        logging.StreamHandler()
+    ]
+)
+
+# -------------------------------------------------------------------
+# Configuration externalisée (via .env)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "5"))
+QUERY_MAX_BATCH = int(os.getenv("QUERY_MAX_BATCH", "32"))
+
+
+def normalize_query(text: str) -> str:
+    # MiniLM est "uncased" : casse et espaces multiples ne changent pas l'embedding
+    return " ".join(text.lower().split())
+
+
+def embed_queries(embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Embeddings d'un lot de requêtes, par le même chemin que `embed_query` (qui n'encode qu'un texte) :
+    pour HuggingFaceEmbeddings, `query_encode_kwargs` (prompt de requête...) s'il est renseigné.
+    """
+    if hasattr(embeddings, "query_encode_kwargs") and hasattr(embeddings, "_embed"):
+        return embeddings._embed(texts, embeddings.query_encode_kwargs or embeddings.encode_kwargs)
+    # autres modèles : embed_documents, équivalent à embed_query pour un modèle symétrique (MiniLM)
+    return embeddings.embed_documents(texts)
+
+
+class QueryEncoder:
+    """
+    Encodeur de requêtes avec cache LRU (clé = texte normalisé) et micro-batching :
+    les requêtes non cachées qui arrivent dans la même fenêtre de quelques ms
+    sont encodées en un seul appel au modèle.
+    """
+
+    def __init__(self, embeddings, cache_size: int = QUERY_CACHE_SIZE,
+                 batch_window_ms: float = QUERY_BATCH_WINDOW_MS, max_batch: int = QUERY_MAX_BATCH):
+        self.embeddings = embeddings
+        self.cache_size = cache_size
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max_batch
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._pending: Dict[str, Future] = {}
+        self._leader = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.batched_queries = 0
+        self.max_batch_seen = 0
+
+    def encode(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return vector
+            self.misses += 1
+            future = self._pending.get(key)
+            if future is None:
+                # requêtes identiques simultanées : un seul encodage
+                future = self._pending[key] = Future()
+            is_leader = not self._leader
+            self._leader = True
+
+        if is_leader:
+            time.sleep(self.batch_window)
+            self._run_batches()
+        return future.result()
+
+    def _run_batches(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._leader = False
+
+        keys = list(pending)
+        for start in range(0, len(keys), self.max_batch):
+            batch = keys[start:start + self.max_batch]
+            try:
+                vectors = embed_queries(self.embeddings, batch)
+            except Exception as e:
+                for key in batch:
+                    pending[key].set_exception(e)
+                continue
+
+            with self._lock:
+                self.batches += 1
+                self.batched_queries += len(batch)
+                self.max_batch_seen = max(self.max_batch_seen, len(batch))
+                for key, vector in zip(batch, vectors):
+                    self._cache[key] = vector
+                    self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            for key, vector in zip(batch, vectors):
+                pending[key].set_result(vector)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "cache_size": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_queries / self.batches, 2) if self.batches else None,
+            "max_batch_size": self.max_batch_seen,
+        }
+
+
+# un encodeur par modèle d'embeddings (partagé par toutes les recherches)
+_encoders: Dict[int, QueryEncoder] = {}
+_encoders_lock = threading.Lock()
+
+
+def get_query_encoder(embeddings) -> QueryEncoder:
+    with _encoders_lock:
+        encoder = _encoders.get(id(embeddings))
+        if encoder is None or encoder.embeddings is not embeddings:
+            encoder = _encoders[id(embeddings)] = QueryEncoder(embeddings)
+        return encoder
+
+
+def query_encoder_stats() -> Dict[str, Dict[str, float]]:
+    return {type(encoder.embeddings).__name__: encoder.stats() for encoder in _encoders.values()}
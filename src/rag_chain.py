@@ -1,9 +1,6 @@
 import logging
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_mistralai import ChatMistralAI
-from langchain_core.runnables import RunnablePassthrough
 from dotenv import load_dotenv
-from src.vectorsearch import search
+from src.shards import search_shards
 import os
 
 # Configuration du logger
@@ -46,6 +43,10 @@ Réponse structurée :
 # configuration du llm
 def config_llm(model_size='small'):
     try:
+        # imports lourds chargés au premier appel seulement
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_mistralai import ChatMistralAI
+
         if model_size == 'small':
             model_name = 'mistral-small-latest'
         else:
@@ -69,6 +70,8 @@ def config_llm(model_size='small'):
 # construction du rag
 def rag_chain(prompt: str, llm):
     try:
+        from langchain_core.runnables import RunnablePassthrough
+
         logging.debug("Construction du pipeline RAG...")
         rag_system = (
             {"context": RunnablePassthrough(), "question": RunnablePassthrough()}
@@ -84,7 +87,7 @@ def rag_chain(prompt: str, llm):
 
 #-------------------------------------------------------------------------------
 # genration de reponse par RAG
-def rag_response(query: str, persist_dir: str, model_size: str='small'):
+def rag_response(query: str, persist_dir: str, model_size: str='small', use_priors: bool=True, near=None, agendas=None):
     try:
         logging.debug(f"Nouvelle requête utilisateur : {query}")
         llm, prompt = config_llm(model_size)
@@ -92,7 +95,8 @@ def rag_response(query: str, persist_dir: str, model_size: str='small'):
             logging.error("LLM ou prompt non initialisé")
             return None, None
 
-        context = search(query, persist_dir)
+        # persist_dir = racine des shards (un index par agenda, interrogés en parallèle)
+        context = search_shards(query, persist_dir, use_priors=use_priors, near=near, agendas=agendas)
         logging.info(f"{len(context)} chunks récupérés depuis la base vectorielle")
 
         # Concaténer les contenus des chunks
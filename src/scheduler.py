@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict
+
+# Configuration du logger
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    handlers=[
+        logging.StreamHandler()
+    ]
+)
+
+# -------------------------------------------------------------------
+# Configuration externalisée (via .env)
+SMALL_MAX_CONCURRENCY = int(os.getenv("SMALL_MAX_CONCURRENCY", "8"))
+SMALL_MAX_QUEUE = int(os.getenv("SMALL_MAX_QUEUE", "32"))
+LARGE_MAX_CONCURRENCY = int(os.getenv("LARGE_MAX_CONCURRENCY", "2"))
+LARGE_MAX_QUEUE = int(os.getenv("LARGE_MAX_QUEUE", "8"))
+QUEUE_TIMEOUT_S = float(os.getenv("QUEUE_TIMEOUT_S", "30"))
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "60"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "20"))
+
+
+class SchedulerRejection(Exception):
+    """Requête refusée par le scheduler (file pleine, quota dépassé ou attente trop longue)."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+# -------------------------------------------------------------------
+# Limiteur de débit par clé API
+class TokenBucket:
+    """Token bucket : `capacity` jetons max, rechargés à `rate` jetons/seconde."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def try_acquire(self) -> float:
+        """Consomme un jeton. Retourne 0 si OK, sinon le délai (s) avant le prochain jeton."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+
+# -------------------------------------------------------------------
+# Voie (lane) par taille de modèle
+class Lane:
+    """File bornée + plafond de concurrence pour une taille de modèle."""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+        self.avg_service_s = 1.0
+
+    def stats(self) -> Dict[str, Any]:
+        served = self.completed or 1
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_depth": self.waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(1000 * self.total_wait_s / served, 2),
+            "max_wait_ms": round(1000 * self.max_wait_s, 2),
+            "avg_service_ms": round(1000 * self.avg_service_s, 2),
+        }
+
+    def estimated_retry_after(self) -> float:
+        """Estimation grossière du temps nécessaire pour vider la file actuelle."""
+        return (self.waiting + 1) * self.avg_service_s / max(1, self.max_concurrency)
+
+
+# -------------------------------------------------------------------
+# Scheduler placé devant rag_response()
+class RequestScheduler:
+    def __init__(self, lanes: Dict[str, Lane], rate_per_minute: float, burst: float, queue_timeout: float):
+        self.lanes = lanes
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.queue_timeout = queue_timeout
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._buckets_lock = threading.Lock()
+        self.rate_limited = 0
+
+    def _check_rate_limit(self, api_key: str):
+        with self._buckets_lock:
+            bucket = self._buckets.get(api_key)
+            if bucket is None:
+                bucket = self._buckets[api_key] = TokenBucket(self.rate, self.burst)
+            retry_after = bucket.try_acquire()
+        if retry_after:
+            self.rate_limited += 1
+            raise SchedulerRejection("rate_limited", retry_after)
+
+    async def submit(self, lane_name: str, api_key: str, func: Callable, /, *args, **kwargs):
+        """Exécute `func` dans un thread une fois admis dans la voie `lane_name`.
+
+        Lève SchedulerRejection si le quota de la clé est épuisé, si la file est pleine
+        ou si l'attente dépasse `queue_timeout`.
+        """
+        self._check_rate_limit(api_key)
+
+        lane = self.lanes.get(lane_name) or self.lanes["small"]
+        if lane.waiting + lane.in_flight >= lane.max_concurrency + lane.max_queue:
+            lane.rejected += 1
+            logging.warning(f"File '{lane.name}' pleine ({lane.waiting} en attente), requête rejetée")
+            raise SchedulerRejection("queue_full", lane.estimated_retry_after())
+
+        lane.waiting += 1
+        enqueued = time.monotonic()
+        try:
+            await asyncio.wait_for(lane._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            lane.rejected += 1
+            logging.warning(f"Attente trop longue dans la file '{lane.name}', requête abandonnée")
+            raise SchedulerRejection("queue_timeout", lane.estimated_retry_after())
+        finally:
+            lane.waiting -= 1
+
+        waited = time.monotonic() - enqueued
+        lane.total_wait_s += waited
+        lane.max_wait_s = max(lane.max_wait_s, waited)
+        lane.in_flight += 1
+        started = time.monotonic()
+        work = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+
+        def release(done):
+            # le thread ne peut pas être interrompu : la place n'est libérée qu'à la fin
+            # réelle de l'appel, même si le client a abandonné (déconnexion, timeout, arrêt)
+            service = time.monotonic() - started
+            lane.avg_service_s = 0.9 * lane.avg_service_s + 0.1 * service
+            lane.in_flight -= 1
+            if not done.cancelled() and done.exception() is None:
+                lane.completed += 1
+            else:
+                lane.failed += 1
+            lane._semaphore.release()
+
+        work.add_done_callback(release)
+        return await asyncio.shield(work)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "lanes": {name: lane.stats() for name, lane in self.lanes.items()},
+            "rate_limited": self.rate_limited,
+            "api_keys_tracked": len(self._buckets),
+        }
+
+
+scheduler = RequestScheduler(
+    lanes={
+        "small": Lane("small", SMALL_MAX_CONCURRENCY, SMALL_MAX_QUEUE),
+        "large": Lane("large", LARGE_MAX_CONCURRENCY, LARGE_MAX_QUEUE),
+    },
+    rate_per_minute=RATE_LIMIT_PER_MINUTE,
+    burst=RATE_LIMIT_BURST,
+    queue_timeout=QUEUE_TIMEOUT_S,
+)
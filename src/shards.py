@@ -0,0 +1,270 @@
+import json
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+from src.priors import load_event_priors, apply_priors, PRIOR_WEIGHT
+from utils.file_utils import atomic_write
+from src.vectorsearch import (get_vectorDB, invalidate_cache, candidates, compact_index, doc_events, set_events,
+                              merge_events, PRIOR_FETCH_FACTOR)
+
+# Configuration du logger
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    handlers=[
+        logging.StreamHandler()
+    ]
+)
+
+# -------------------------------------------------------------------
+# Configuration externalisée (via .env)
+DEFAULT_AGENDA_UID = os.getenv("OPENAGENDA_UID", "82290100")
+# agendas servis (un shard d'index par agenda), séparés par des virgules
+AGENDA_UIDS = [uid.strip() for uid in os.getenv("AGENDA_UIDS", DEFAULT_AGENDA_UID).split(",") if uid.strip()]
+# budget mémoire des shards chargés (0 = illimité) ; au-delà, les moins récemment utilisés sont déchargés
+SHARD_MEMORY_BUDGET_MB = float(os.getenv("SHARD_MEMORY_BUDGET_MB", "0"))
+SHARD_SEARCH_WORKERS = int(os.getenv("SHARD_SEARCH_WORKERS", "4"))
+
+MANIFEST_FILE = "manifest.json"
+# fichiers d'un index (ancienne disposition : directement à la racine de VECTORDB_PATH)
+INDEX_FILES = ("index.faiss", "index.pkl", "geo.npz")
+
+
+# -------------------------------------------------------------------
+# Disposition sur disque : <VECTORDB_PATH>/<agenda>/ et <DATA_DIR>/<DATA_FILE>_<agenda>.parquet
+def shard_dir(root: str, agenda_uid: str) -> str:
+    return os.path.join(root, str(agenda_uid))
+
+
+def shard_data_file(data_file: str, agenda_uid: str) -> str:
+    return f"{data_file}_{agenda_uid}"
+
+
+def migrate_legacy_layout(root: str, data_dir: str, data_file: str, agenda_uid: str = DEFAULT_AGENDA_UID):
+    """
+    Ancienne disposition (un seul index à la racine, un seul fichier d'événements) :
+    déplacée une fois pour toutes dans le shard de l'agenda par défaut.
+    """
+    target = Path(shard_dir(root, agenda_uid))
+    if (Path(root) / "index.faiss").exists() and not (target / "index.faiss").exists():
+        target.mkdir(parents=True, exist_ok=True)
+        for name in INDEX_FILES:
+            if (Path(root) / name).exists():
+                os.replace(Path(root) / name, target / name)
+        logging.info(f"Index existant déplacé dans le shard {target}")
+
+    new_name = shard_data_file(data_file, agenda_uid)
+    if not any((Path(data_dir) / f"{new_name}{ext}").exists() for ext in (".parquet", ".csv")):
+        for ext in (".parquet", ".csv"):
+            legacy = Path(data_dir) / f"{data_file}{ext}"
+            if legacy.exists():
+                os.replace(legacy, Path(data_dir) / f"{new_name}{ext}")
+                logging.info(f"Événements {legacy} renommés en {new_name}{ext}")
+                break
+
+
+# -------------------------------------------------------------------
+# Manifest : version et emprise géographique de chaque shard
+def read_manifest(persist_dir: str) -> Dict:
+    try:
+        with open(Path(persist_dir) / MANIFEST_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_manifest(persist_dir: str, agenda_uid: str, events=None, **extra) -> Dict:
+    """Incrémente la version du shard ; `events` (DataFrame) met à jour le nombre d'événements et l'emprise."""
+    manifest = read_manifest(persist_dir)
+    manifest.update(agenda_uid=str(agenda_uid), version=manifest.get("version", 0) + 1,
+                    updated_at=datetime.now(timezone.utc).isoformat(), **extra)
+    if events is not None:
+        manifest["events"] = int(len(events))
+        coordinates = events[["latitude", "longitude"]].dropna() if "latitude" in events else []
+        manifest["bbox"] = [
+            float(coordinates["latitude"].min()), float(coordinates["latitude"].max()),
+            float(coordinates["longitude"].min()), float(coordinates["longitude"].max())
+        ] if len(coordinates) else None
+
+    os.makedirs(persist_dir, exist_ok=True)
+    with atomic_write(Path(persist_dir) / MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def _bbox_within_reach(bbox, near) -> bool:
+    """False si le cercle `near` ne peut pas toucher l'emprise du shard (shard ignoré)."""
+    if not bbox or near is None:
+        return True
+    latitude, longitude, radius_km = near
+    dlat = radius_km / 111.32
+    dlon = radius_km / (111.32 * max(math.cos(math.radians(latitude)), 1e-6))
+    lat_min, lat_max, lon_min, lon_max = bbox
+    return (lat_min - dlat <= latitude <= lat_max + dlat) and (lon_min - dlon <= longitude <= lon_max + dlon)
+
+
+def _disk_size(persist_dir: str) -> int:
+    # approximation de l'empreinte mémoire d'un shard chargé : taille de ses fichiers d'index
+    return sum((Path(persist_dir) / name).stat().st_size
+               for name in INDEX_FILES if (Path(persist_dir) / name).exists())
+
+
+# -------------------------------------------------------------------
+# Gestion des shards : chargement paresseux, déchargement LRU sous budget mémoire
+class ShardManager:
+
+    def __init__(self, root: str, agenda_uids: List[str] = AGENDA_UIDS,
+                 memory_budget_mb: float = SHARD_MEMORY_BUDGET_MB, workers: int = SHARD_SEARCH_WORKERS):
+        self.root = root
+        self.agenda_uids = list(agenda_uids)
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="shard-search")
+        self._loaded: "OrderedDict[str, int]" = OrderedDict()   # agenda -> taille (octets), ordre LRU
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.unloads = 0
+
+    def available(self) -> List[str]:
+        return [uid for uid in self.agenda_uids
+                if (Path(shard_dir(self.root, uid)) / "index.faiss").exists()]
+
+    def relevant(self, agendas: Optional[List[str]] = None, near=None) -> List[str]:
+        """Shards à interroger : agendas demandés, et dont l'emprise peut contenir le point recherché."""
+        uids = [uid for uid in self.available() if not agendas or uid in agendas]
+        if near is not None:
+            uids = [uid for uid in uids
+                    if _bbox_within_reach(read_manifest(shard_dir(self.root, uid)).get("bbox"), near)]
+        return uids
+
+    def acquire(self, agenda_uid: str):
+        """(db, expiry, geo) du shard, chargé à la demande ; None si indisponible."""
+        persist_dir = shard_dir(self.root, agenda_uid)
+        db, expiry, geo = get_vectorDB(persist_dir)
+        if not db:
+            return None
+        with self._lock:
+            if agenda_uid not in self._loaded:
+                self.loads += 1
+                self._loaded[agenda_uid] = _disk_size(persist_dir)
+            self._loaded.move_to_end(agenda_uid)
+            self._evict()
+        return db, expiry, geo
+
+    def _evict(self):
+        # le shard le plus récent n'est jamais déchargé (il est en cours d'utilisation)
+        if self.memory_budget <= 0:
+            return
+        while len(self._loaded) > 1 and sum(self._loaded.values()) > self.memory_budget:
+            agenda_uid, _ = self._loaded.popitem(last=False)
+            invalidate_cache(shard_dir(self.root, agenda_uid))
+            self.unloads += 1
+            logging.info(f"Shard {agenda_uid} déchargé (budget mémoire {self.memory_budget / 2**20:.0f} Mo)")
+
+    def unload(self, agenda_uid: str):
+        with self._lock:
+            self._loaded.pop(agenda_uid, None)
+        invalidate_cache(shard_dir(self.root, agenda_uid))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            loaded = dict(self._loaded)
+        return {
+            "agendas": self.agenda_uids,
+            "loaded": list(loaded),
+            "loaded_mb": round(sum(loaded.values()) / 2**20, 1),
+            "budget_mb": round(self.memory_budget / 2**20, 1) or None,
+            "loads": self.loads,
+            "unloads": self.unloads,
+            "versions": {uid: read_manifest(shard_dir(self.root, uid)).get("version") for uid in self.available()},
+        }
+
+
+_managers: Dict[str, ShardManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_shard_manager(root: str) -> ShardManager:
+    with _managers_lock:
+        if root not in _managers:
+            _managers[root] = ShardManager(root)
+        return _managers[root]
+
+
+def shard_stats() -> Dict[str, Dict]:
+    return {root: manager.stats() for root, manager in _managers.items()}
+
+
+# -------------------------------------------------------------------
+# Recherche distribuée : interrogation parallèle des shards puis fusion par score
+def _merge(results) -> list:
+    """
+    Fusionne les [(doc, pertinence)] de chaque shard, triés par pertinence.
+    Un même chunk présent dans plusieurs agendas est gardé une fois, avec la meilleure
+    pertinence et l'union de ses événements sources (copie : le docstore n'est pas modifié).
+    """
+    best = {}
+    for doc, score in (item for shard_results in results for item in shard_results):
+        kept = best.get(doc.page_content)
+        if kept is None:
+            best[doc.page_content] = (doc, score)
+            continue
+        (first, _), (second, _) = sorted([kept, (doc, score)], key=lambda item: item[1], reverse=True)
+        merged = type(first)(page_content=first.page_content, metadata=dict(first.metadata))
+        set_events(merged.metadata, merge_events(doc_events(first.metadata), doc_events(second.metadata)))
+        best[doc.page_content] = (merged, max(score, kept[1]))
+    return sorted(best.values(), key=lambda item: item[1], reverse=True)
+
+
+def search_shards(query: str, root: str, top_k: int = 5, use_priors: bool = True,
+                  prior_weight: float = PRIOR_WEIGHT, near=None, agendas: Optional[List[str]] = None):
+    """
+    Recherche des `top_k` chunks les plus proches dans tous les shards concernés (en parallèle).
+    Les pertinences sont comparables d'un shard à l'autre (même modèle d'embeddings, même distance).
+    """
+    try:
+        manager = get_shard_manager(root)
+        uids = manager.relevant(agendas, near)
+        if not uids:
+            logging.error("Impossible d'effectuer la recherche : aucun shard disponible")
+            return []
+
+        # priors globaux (par événement), stockés à la racine de VECTORDB_PATH
+        priors = load_event_priors(root) if use_priors and prior_weight else {}
+        fetch_k = top_k * PRIOR_FETCH_FACTOR if priors else top_k
+
+        def search_one(agenda_uid):
+            loaded = manager.acquire(agenda_uid)
+            return candidates(*loaded, query, fetch_k, near) if loaded else []
+
+        if len(uids) == 1:
+            results = [search_one(uids[0])]
+        else:
+            results = list(manager.executor.map(search_one, uids))
+
+        merged = _merge(results)
+        if priors:
+            merged = apply_priors(merged, priors, prior_weight)
+        docs = [doc for doc, _ in merged[:top_k]]
+
+        logging.info(f"{len(docs)} chunks récupérés depuis {len(uids)} shard(s)")
+        return docs
+    except Exception as e:
+        logging.error(f"Erreur lors de la recherche dans les shards : {e}")
+        return []
+
+
+def compact_shards(root: str, agenda_uids: Optional[List[str]] = None) -> int:
+    """Compaction de chaque shard (nouvelle version si des vecteurs ont été supprimés). Retourne le total supprimé."""
+    removed = 0
+    for agenda_uid in agenda_uids or get_shard_manager(root).available():
+        count = compact_index(shard_dir(root, agenda_uid))
+        if count:
+            write_manifest(shard_dir(root, agenda_uid), agenda_uid, compacted=count)
+        removed += count
+    return removed
@@ -1,27 +1,57 @@
+from __future__ import annotations
+
 import logging
+import math
 import os
+import threading
+import time
+from datetime import datetime, timezone
 from pathlib import Path
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+from functools import lru_cache
+from typing import TYPE_CHECKING
+from src.priors import load_event_priors, apply_priors, PRIOR_WEIGHT
+from src.query_encoder import get_query_encoder
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# nombre de candidats récupérés par résultat final quand les priors sont appliqués
+PRIOR_FETCH_FACTOR = int(os.getenv("PRIOR_FETCH_FACTOR", "4"))
 
 # Configuration du logger
 logging.basicConfig(
-    level=logging.INFO,  
+    level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(message)s",
     handlers=[
-        logging.StreamHandler()             
+        logging.StreamHandler()
     ]
 )
 
+# base chargée une seule fois par dossier (rechargée si index.faiss change)
+_cache = {}
+_cache_lock = threading.Lock()      # accès au dictionnaire uniquement, jamais pendant un chargement
+_load_locks = {}                    # un verrou de chargement par dossier
+
+
+@lru_cache(maxsize=1)
+def get_embeddings():
+    """Modèle d'embeddings chargé une seule fois et partagé (indexation et recherche)."""
+    # import lourd (sentence-transformers) chargé au premier appel
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+
+
 def load_vectorDB(persist_dir: str):
     try:
+        from langchain_community.vectorstores import FAISS
+
         db_path = Path(persist_dir).resolve()
         logging.debug(f"Chargement de la base vectorielle depuis : {db_path}")
 
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
         db = FAISS.load_local(
             folder_path=db_path,
-            embeddings=embeddings,
+            embeddings=get_embeddings(),
             allow_dangerous_deserialization=True
         )
 
@@ -31,19 +61,244 @@ def load_vectorDB(persist_dir: str):
         logging.error(f"Erreur lors du chargement de la base FAISS : {e}")
         return None
 
-def search(query: str, persist_dir: str, top_k: int = 5):
+#---------------------------------------------------------------------------
+# Expiration des événements passés (tombstones sur date_end)
+def parse_date_end(value) -> float:
+    """Timestamp (s) de fin d'un événement ; +inf si inconnu (jamais expiré)."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return math.inf
     try:
-        logging.debug(f"Recherche lancée pour la requête : {query}")
+        if not isinstance(value, datetime):
+            value = datetime.fromisoformat(str(value))
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    except (TypeError, ValueError):
+        return math.inf
+
+
+# champs propres à chaque événement source d'un chunk
+EVENT_FIELDS = ("id", "title", "city", "date_end", "latitude", "longitude")
+
+
+def event_info(metadata: dict) -> dict:
+    return {field: metadata.get(field) for field in EVENT_FIELDS}
+
+
+def doc_events(metadata: dict) -> list:
+    """
+    Événements sources d'un chunk (un chunk dédoublonné peut en avoir plusieurs).
+    Les index construits avant `events` n'ont que les champs du premier événement.
+    """
+    if metadata.get("events"):
+        return metadata["events"]
+    others = (metadata.get("event_ids") or [])[1:]
+    return [event_info(metadata)] + [{**dict.fromkeys(EVENT_FIELDS), "id": event_id} for event_id in others]
+
+
+def set_events(metadata: dict, events: list):
+    """
+    Réécrit les métadonnées d'un chunk à partir de ses événements sources :
+    `events` (titre, ville, date de fin, coordonnées de chacun), `event_ids`,
+    et les champs de premier niveau, qui décrivent tous le premier événement.
+    """
+    metadata["events"] = events
+    metadata["event_ids"] = [event["id"] for event in events]
+    metadata.update(events[0])
+
+
+def merge_events(events: list, others: list) -> list:
+    """`events` suivis des événements de `others` qui n'y figurent pas encore (même id)."""
+    known = {str(event["id"]) for event in events}
+    return list(events) + [event for event in others if str(event["id"]) not in known]
+
+
+def chunk_date_end(metadata: dict) -> float:
+    # un chunk n'expire que lorsque tous ses événements sont terminés
+    return max(parse_date_end(event.get("date_end", metadata.get("date_end"))) for event in doc_events(metadata))
+
+
+def build_expiry_array(db) -> np.ndarray:
+    """Date de fin de chaque vecteur, alignée sur les positions de l'index FAISS."""
+    import numpy as np
+
+    expiry = np.full(db.index.ntotal, math.inf, dtype=np.float64)
+    for position, docstore_id in db.index_to_docstore_id.items():
+        doc = db.docstore.search(docstore_id)
+        expiry[position] = chunk_date_end(getattr(doc, "metadata", {}))
+    return expiry
+
+
+def _cached(persist_dir: str, mtime: float):
+    with _cache_lock:
+        cached = _cache.get(persist_dir)
+    return cached[1:] if cached and cached[0] == mtime else None
+
+
+def _load_lock(persist_dir: str) -> threading.Lock:
+    with _cache_lock:
+        return _load_locks.setdefault(persist_dir, threading.Lock())
+
+
+def get_vectorDB(persist_dir: str):
+    """
+    Retourne (db, expiry, geo) depuis le cache mémoire, en rechargeant si l'index a changé.
+    Le chargement se fait hors du verrou du cache : un hit, ou le chargement d'un autre
+    dossier (shard), n'attend jamais qu'un index soit rechargé.
+    """
+    try:
+        mtime = (Path(persist_dir) / "index.faiss").stat().st_mtime
+    except FileNotFoundError:
+        return None, None, None
+
+    cached = _cached(persist_dir, mtime)
+    if cached:
+        return cached
+    # un seul chargement à la fois pour un même dossier ; les requêtes concurrentes en profitent
+    with _load_lock(persist_dir):
+        cached = _cached(persist_dir, mtime)
+        if cached:
+            return cached
         db = load_vectorDB(persist_dir)
+        if not db:
+            return None, None, None
+        from src.geo_index import load_or_build_geo_index
+
+        expiry = build_expiry_array(db)
+        geo = load_or_build_geo_index(db, persist_dir)
+        with _cache_lock:
+            _cache[persist_dir] = (mtime, db, expiry, geo)
+        logging.info(f"{int((expiry < time.time()).sum())}/{len(expiry)} vecteurs expirés (ignorés à la recherche)")
+        return db, expiry, geo
+
+
+def invalidate_cache(persist_dir: str = None):
+    with _cache_lock:
+        if persist_dir is None:
+            _cache.clear()
+        else:
+            _cache.pop(persist_dir, None)
+
+
+def _relevance(distance: float) -> float:
+    # même normalisation que langchain pour une distance euclidienne
+    return 1.0 - distance / math.sqrt(2)
+
+
+def _encode_query(db, query: str):
+    import numpy as np
+
+    # cache LRU + micro-batching des embeddings de requêtes
+    return np.array([get_query_encoder(db.embeddings).encode(query)], dtype=np.float32)
+
+
+def _scored_docs(db, distances, positions):
+    return [
+        (db.docstore.search(db.index_to_docstore_id[int(position)]), _relevance(float(distance)))
+        for distance, position in zip(distances, positions)
+    ]
+
+
+def _live_candidates(db, expiry: np.ndarray, query: str, k: int):
+    """Top-k (doc, pertinence) en sautant les vecteurs expirés ; élargit la recherche si besoin."""
+    import numpy as np
+
+    now = time.time()
+    ntotal = db.index.ntotal
+    query_vector = _encode_query(db, query)
+
+    fetch_k = min(k, ntotal)
+    while True:
+        distances, positions = db.index.search(query_vector, fetch_k)
+        distances, positions = distances[0], positions[0]
+        valid = positions >= 0
+        live = valid & (expiry[np.where(valid, positions, 0)] >= now)
+        if live.sum() >= k or fetch_k >= ntotal:
+            break
+        fetch_k = min(fetch_k * 2, ntotal)
+
+    return _scored_docs(db, distances[live][:k], positions[live][:k])
+
+
+def _nearby_candidates(db, expiry: np.ndarray, geo, query: str, k: int, near):
+    """
+    Pré-filtrage spatial : seules les positions situées dans le rayon (et non expirées)
+    sont classées par distance vectorielle, en reconstruisant leurs vecteurs depuis l'index.
+    """
+    import numpy as np
+
+    latitude, longitude, radius_km = near
+    positions = geo.query(latitude, longitude, radius_km)
+    positions = positions[expiry[positions] >= time.time()]
+    if len(positions) == 0:
+        return []
+
+    query_vector = _encode_query(db, query)[0]
+    vectors = db.index.reconstruct_batch(positions)
+    distances = ((vectors - query_vector) ** 2).sum(axis=1)
+    best = np.argsort(distances)[:k]
+    return _scored_docs(db, distances[best], positions[best])
+
+
+def candidates(db, expiry: np.ndarray, geo, query: str, k: int, near=None):
+    """[(doc, pertinence)] d'un index chargé, triés par pertinence (filtre spatial si `near`)."""
+    if near is not None:
+        return _nearby_candidates(db, expiry, geo, query, k, near)
+    return _live_candidates(db, expiry, query, k)
+
+
+def search(query: str, persist_dir: str, top_k: int = 5, use_priors: bool = True, prior_weight: float = PRIOR_WEIGHT,
+           near=None):
+    """
+    Recherche des `top_k` chunks les plus proches de la requête.
+    `near` = (latitude, longitude, rayon_km) restreint la recherche aux événements situés dans ce rayon.
+    """
+    try:
+        logging.debug(f"Recherche lancée pour la requête : {query}")
+        db, expiry, geo = get_vectorDB(persist_dir)
         if not db:
             logging.error("Impossible d'effectuer la recherche : base FAISS non chargée")
             return []
 
-        retriever = db.as_retriever(search_kwargs={"k": top_k})
-        results = retriever.invoke(query)
+        priors = load_event_priors(persist_dir) if use_priors and prior_weight else {}
+        fetch_k = top_k * PRIOR_FETCH_FACTOR if priors else top_k
+        scored = candidates(db, expiry, geo, query, fetch_k, near)
+
+        if priors:
+            # on élargit la recherche puis on re-classe avec les priors issus du feedback
+            scored = apply_priors(scored, priors, prior_weight)
+        results = [doc for doc, _ in scored[:top_k]]
 
         logging.info(f"{len(results)} chunks récupérés pour la requête")
         return results  # le texte principal est dans page_content
     except Exception as e:
         logging.error(f"Erreur lors de la recherche dans la base FAISS : {e}")
         return []
+
+#---------------------------------------------------------------------------
+# Compaction : suppression physique des vecteurs expirés (sans /rebuild)
+def compact_index(persist_dir: str):
+    """Supprime de l'index et du docstore les chunks dont date_end est passée. Retourne le nombre supprimé."""
+    import numpy as np
+
+    try:
+        db = load_vectorDB(persist_dir)
+        if not db:
+            return 0
+        expiry = build_expiry_array(db)
+        expired = np.flatnonzero(expiry < time.time())
+        if len(expired) == 0:
+            logging.info("Compaction : aucun vecteur expiré")
+            return 0
+        if len(expired) == db.index.ntotal:
+            logging.warning("Compaction ignorée : tous les vecteurs sont expirés (un /rebuild est nécessaire)")
+            return 0
+
+        db.delete([db.index_to_docstore_id[int(position)] for position in expired])
+        db.save_local(persist_dir)
+        invalidate_cache(persist_dir)
+        logging.info(f"Compaction : {len(expired)} vecteurs expirés supprimés, {db.index.ntotal} restants")
+        return int(len(expired))
+    except Exception as e:
+        logging.error(f"Erreur lors de la compaction de la base FAISS : {e}")
+        return 0
@@ -0,0 +1,70 @@
+import hashlib
+import os
+import tempfile
+import pytest
+from langchain_core.embeddings import Embeddings
+
+# pied de page commun à tous les événements de test (chunk dédoublonné)
+FOOTER = "Informations pratiques : entrée libre, réservation conseillée auprès de l'accueil."
+DATE_END = "2030-01-01T18:00:00+01:00"
+ENDED = "2020-01-01T00:00:00+00:00"
+
+# base de feedback temporaire : la suite de tests ne modifie jamais data/feedback.db
+os.environ.setdefault("FEEDBACK_DB_DIR", tempfile.mkdtemp(prefix="feedback-tests-"))
+
+
+class FakeEmbeddings(Embeddings):
+    """Embeddings déterministes (sac de mots haché), sans téléchargement de modèle."""
+
+    dim = 64
+
+    def _vector(self, text):
+        import numpy as np
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1
+        return (vector / (np.linalg.norm(vector) or 1)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+@pytest.fixture
+def fake_embeddings(monkeypatch):
+    from src import embedding, vectorsearch
+
+    fake = FakeEmbeddings()
+    monkeypatch.setattr(vectorsearch, "get_embeddings", lambda: fake)
+    monkeypatch.setattr(embedding, "get_embeddings", lambda: fake)
+    yield fake
+    vectorsearch.invalidate_cache()
+
+
+@pytest.fixture
+def footer():
+    return FOOTER
+
+
+@pytest.fixture
+def make_events():
+    """
+    Fabrique de DataFrames d'événements (schéma OpenAgenda) : un texte propre à chaque événement
+    suivi du pied de page commun. `changed` modifie titre et texte, `ended` met la fin en 2020.
+    """
+    import pandas as pd
+
+    def make(ids, changed=(), ended=()):
+        return pd.DataFrame([
+            {"id": i, "title": f"t{i} modifié" if i in changed else f"t{i}", "description": "",
+             "city": f"ville{i}", "date_end": ENDED if i in ended else DATE_END,
+             "latitude": 48.8 + i / 100, "longitude": 2.35,
+             "text_for_rag": f"Événement {i} {'modifié' if i in changed else 'initial'} : "
+                             + f"description propre à l'événement {i}. " * 4 + "\n\n" + FOOTER}
+            for i in ids
+        ])
+
+    return make
@@ -1,8 +1,12 @@
 from fastapi.testclient import TestClient
 import os
+import pandas as pd
+import pytest
 from unittest.mock import patch
 from dotenv import load_dotenv
 from app import app
+from src.scheduler import SchedulerRejection
+from utils.feedback_writer import FeedbackWriter, FeedbackQueueFull
 
 load_dotenv()
 
@@ -82,3 +86,167 @@ def test_with_fake_key():
     #sans api key
     response = client.post("/chat", json={"question": "test", "model_size": "small"}) 
     assert response.status_code == 401
+
+
+def test_chat_rejected_by_scheduler():
+    # Test 429 : file pleine -> Retry-After
+    data = {'question': 'test', 'model_size': 'large'}
+    with patch("app.scheduler.submit", side_effect=SchedulerRejection("queue_full", 3)):
+        response = client.post("/chat", json=data, headers={"X-API-Key": API_KEY_ADMIN})
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "3"
+
+
+def test_metrics():
+    response = client.get("/metrics", headers={"X-API-Key": API_KEY_ADMIN})
+    assert response.status_code == 200
+    lanes = response.json()["scheduler"]["lanes"]
+    assert set(lanes) == {"small", "large"}
+    assert "queue_depth" in lanes["small"]
+
+
+def test_feedback():
+    data = {"question": "test", "answer": "réponse", "sources": "", "feedback": "positive",
+            "model_size": "small", "source_ids": ["78037061"]}
+    with patch("app.feedback_writer.enqueue", return_value=True) as enqueue:
+        response = client.post("/feedback", json=data, headers={"X-API-Key": API_KEY_ADMIN})
+        assert response.status_code == 202
+        assert enqueue.call_args.kwargs["value"] == 1
+        assert enqueue.call_args.kwargs["source_ids"] == ["78037061"]
+
+    with patch("app.feedback_writer.enqueue", side_effect=FeedbackQueueFull()):
+        response = client.post("/feedback", json=data, headers={"X-API-Key": API_KEY_ADMIN})
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+
+    response = client.post("/feedback", json={**data, "answer": "x" * 10001}, headers={"X-API-Key": API_KEY_ADMIN})
+    assert response.status_code == 422
+
+    data["feedback"] = "bof"
+    response = client.post("/feedback", json=data, headers={"X-API-Key": API_KEY_ADMIN})
+    assert response.status_code == 422
+
+
+def test_feedback_queue_bounded():
+    writer = FeedbackWriter(max_queue=2)
+    writer.start = lambda: None   # pas de thread d'écriture : la file se remplit
+    assert writer.enqueue("q", "a", "", "positive", 1)
+    assert writer.enqueue("q", "a", "", "negative", 0)
+    with pytest.raises(FeedbackQueueFull):
+        writer.enqueue("q", "a", "", "positive", 1)
+    assert writer.stats()["pending"] == 2
+    assert writer.stats()["rejected"] == 1
+
+
+def test_feedback_analytics():
+    response = client.get("/feedback/analytics", headers={"X-API-Key": "wrong"})
+    assert response.status_code == 403
+
+    rollups = {"most_negative_events": [], "most_positive_events": [], "per_day": [], "per_model": []}
+    with patch("utils.feedback_db.get_feedback_analytics", return_value=rollups):
+        response = client.get("/feedback/analytics", headers={"X-API-Key": API_KEY_ADMIN})
+        assert response.status_code == 200
+        assert response.json() == rollups
+
+
+def test_chat_ab_arm():
+    data = {'question': 'test', 'model_size': 'small'}
+    with patch("app.rag_response", return_value=("réponse", [])) as rag, \
+         patch("app.choose_ab_arm", return_value="control"), patch("app.record_served") as served:
+        response = client.post("/chat", json=data, headers={"X-API-Key": API_KEY_ADMIN})
+        assert response.status_code == 200
+        assert response.json()["ab_arm"] == "control"
+        assert rag.call_args.kwargs["use_priors"] is False
+        served.assert_called_once_with("control")
+
+    # requêtes refusées ou en erreur : non comptées comme servies
+    with patch("app.rag_response", side_effect=Exception("boom")), patch("app.record_served") as served:
+        assert client.post("/chat", json=data, headers={"X-API-Key": API_KEY_ADMIN}).status_code == 500
+        served.assert_not_called()
+    with patch("app.scheduler.submit", side_effect=SchedulerRejection("queue_full", 3)), \
+         patch("app.record_served") as served:
+        assert client.post("/chat", json=data, headers={"X-API-Key": API_KEY_ADMIN}).status_code == 429
+        served.assert_not_called()
+
+
+def test_compact():
+    response = client.post("/compact", headers={"X-API-Key": "wrong"})
+    assert response.status_code == 403
+
+    with patch("app.compact_shards", return_value=3):
+        response = client.post("/compact", headers={"X-API-Key": API_KEY_ADMIN})
+        assert response.status_code == 200
+        assert response.json() == {"info": "3 vecteurs expirés supprimés de l'index"}
+
+
+def test_chat_near_point():
+    data = {'question': 'test', 'model_size': 'small', 'latitude': 48.853, 'longitude': 2.369, 'radius_km': 1.5}
+    with patch("app.rag_response", return_value=("réponse", [])) as rag:
+        response = client.post("/chat", json=data, headers={"X-API-Key": API_KEY_ADMIN})
+        assert response.status_code == 200
+        assert rag.call_args.kwargs["near"] == (48.853, 2.369, 1.5)
+
+    # latitude sans longitude
+    data = {'question': 'test', 'model_size': 'small', 'latitude': 48.853}
+    response = client.post("/chat", json=data, headers={"X-API-Key": API_KEY_ADMIN})
+    assert response.status_code == 422
+
+
+def test_chat_agendas():
+    data = {'question': 'test', 'model_size': 'small', 'agendas': ['82290100']}
+    with patch("app.rag_response", return_value=("réponse", [])) as rag:
+        response = client.post("/chat", json=data, headers={"X-API-Key": API_KEY_ADMIN})
+        assert response.status_code == 200
+        assert rag.call_args.kwargs["agendas"] == ['82290100']
+
+
+def test_rebuild_unknown_agenda():
+    response = client.post("/rebuild", params={"agenda": "inconnu"}, headers={"X-API-Key": API_KEY_ADMIN})
+    assert response.status_code == 404
+
+
+def test_chat_sources_per_event():
+    from langchain_core.documents import Document
+
+    events = [{"id": 1, "title": "t1", "city": "Paris", "date_end": "2020-01-01T00:00:00+00:00"},
+              {"id": 8, "title": "t8", "city": "Saint-Denis", "date_end": "2030-01-01T00:00:00+00:00"}]
+    shared = Document(page_content="pied de page", metadata={**events[0], "event_ids": [1, 8], "events": events})
+    data = {'question': 'test', 'model_size': 'small'}
+    with patch("app.rag_response", return_value=("réponse", [shared])):
+        response = client.post("/chat", json=data, headers={"X-API-Key": API_KEY_ADMIN})
+        assert response.status_code == 200
+        body = response.json()
+        assert body["source_ids"] == ["8"]
+        assert "t8 (Saint-Denis, fin: 2030-01-01T00:00:00+00:00)" in body["sources"]
+        assert "t1" not in body["sources"]
+
+
+def test_chat_sources_shared_chunk_limited():
+    from langchain_core.documents import Document
+    from utils.pydantic_utils import MAX_SOURCE_IDS
+
+    events = [{"id": i, "title": f"t{i}", "city": "Paris", "date_end": "2030-01-01T00:00:00+00:00"}
+              for i in range(1, 81)]
+    footer = Document(page_content="pied de page", metadata={**events[0], "event_ids": list(range(1, 81)),
+                                                             "events": events})
+    own = Document(page_content="texte de t5", metadata={**events[4], "event_ids": [5], "events": [events[4]]})
+    data = {'question': 'test', 'model_size': 'small'}
+
+    # le chunk partagé ne crédite que les événements retrouvés par leur propre texte
+    with patch("app.rag_response", return_value=("réponse", [footer, own])):
+        assert client.post("/chat", json=data, headers={"X-API-Key": API_KEY_ADMIN}).json()["source_ids"] == ["5"]
+
+    # seul un chunk partagé : borné pour rester acceptable par /feedback
+    with patch("app.rag_response", return_value=("réponse", [footer])):
+        body = client.post("/chat", json=data, headers={"X-API-Key": API_KEY_ADMIN}).json()
+    assert len(body["source_ids"]) == MAX_SOURCE_IDS
+    feedback = {"question": "test", "feedback": "positive", "source_ids": body["source_ids"]}
+    with patch("app.feedback_writer.enqueue", return_value=True):
+        assert client.post("/feedback", json=feedback, headers={"X-API-Key": API_KEY_ADMIN}).status_code == 202
+
+
+def test_rebuild_fails_when_shard_not_built():
+    with patch("src.pipeline.fetch_events", return_value=pd.DataFrame({"id": [1]})), \
+         patch("src.pipeline.build_shards", return_value=[]), patch("app.migrate_legacy_layout"):
+        response = client.post("/rebuild", headers={"X-API-Key": API_KEY_ADMIN})
+        assert response.status_code == 500
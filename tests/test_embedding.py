@@ -0,0 +1,49 @@
+import pytest
+from langchain_core.documents import Document
+from src import embedding
+from src.embedding import dedup_chunks, chunk_stats, split_documents, documents_to_chunks
+from src.vectorsearch import chunk_date_end, parse_date_end
+
+
+def test_dedup_keeps_per_event_metadata(make_events, footer):
+    events = make_events(range(1, 9), ended=[1])
+    chunks = documents_to_chunks(events, chunk_size=120, chunk_overlap=0)
+    shared = [chunk for chunk in chunks if chunk.page_content == footer]
+    assert len(shared) == 1
+
+    metadata = shared[0].metadata
+    assert metadata["event_ids"] == list(range(1, 9))
+    assert (metadata["id"], metadata["title"], metadata["date_end"]) == (1, "t1", "2020-01-01T00:00:00+00:00")
+    by_id = {event["id"]: event for event in metadata["events"]}
+    assert by_id[8]["title"] == "t8" and by_id[8]["city"] == "ville8" and by_id[8]["latitude"] == pytest.approx(48.88)
+    assert by_id[1]["date_end"].startswith("2020")
+    # le chunk partagé vit aussi longtemps que son dernier événement
+    assert chunk_date_end(metadata) == parse_date_end(events["date_end"].max())
+
+
+def test_dedup_merges_same_event_once():
+    chunks = [Document(page_content="même texte", metadata={"id": 1, "title": "a"}),
+              Document(page_content="même texte", metadata={"id": 1, "title": "a"}),
+              Document(page_content="autre texte", metadata={"id": 2, "title": "b"})]
+    unique = dedup_chunks(chunks)
+    assert [chunk.metadata["event_ids"] for chunk in unique] == [[1], [2]]
+
+
+def test_chunk_stats():
+    chunks = dedup_chunks([Document(page_content="x" * size, metadata={"id": event_id})
+                           for size, event_id in [(10, 1), (20, 1), (30, 2)]])
+    stats = chunk_stats(chunks)
+    assert stats["count"] == 3
+    assert (stats["size_min"], stats["size_median"], stats["size_max"]) == (10, 20, 30)
+    assert stats["total_chars"] == 60
+    assert stats["chunks_per_event_max"] == 2
+    assert chunk_stats([]) == {"count": 0}
+
+
+def test_parallel_split_matches_sequential(monkeypatch):
+    documents = [Document(page_content="phrase de test. " * 40, metadata={"id": i}) for i in range(20)]
+    sequential = split_documents(documents, 100, 10, workers=1)
+
+    monkeypatch.setattr(embedding, "PARALLEL_CHUNKING_MIN_DOCS", 4)
+    parallel = split_documents(documents, 100, 10, workers=3)
+    assert [(c.page_content, c.metadata) for c in parallel] == [(c.page_content, c.metadata) for c in sequential]
@@ -0,0 +1,40 @@
+import pandas as pd
+from src.event_store import save_events, load_events, append_events, diff_events
+
+
+def test_schema_and_order(tmp_path, make_events):
+    save_events(make_events([3, 1, 2]), tmp_path, "events")
+    df = load_events(tmp_path, "events")
+    assert df["id"].tolist() == [1, 2, 3]
+    assert str(df["id"].dtype) == "int64"
+    assert str(df["city"].dtype) == "category"
+    assert isinstance(df["date_end"].dtype, pd.DatetimeTZDtype) and str(df["date_end"].dt.tz) == "UTC"
+    assert df["date_end"].iloc[0] == pd.Timestamp("2030-01-01T17:00:00Z")
+
+
+def test_read_selected_columns(tmp_path, make_events):
+    save_events(make_events([1]), tmp_path, "events")
+    df = load_events(tmp_path, "events", columns=["id", "title"])
+    assert list(df.columns) == ["id", "title"]
+
+
+def test_append_replaces_same_id(tmp_path, make_events):
+    save_events(make_events([1, 2]), tmp_path, "events")
+    append_events(make_events([2, 3], changed=[2]), tmp_path, "events")
+    df = load_events(tmp_path, "events")
+    assert df["id"].tolist() == [1, 2, 3]
+    assert df.set_index("id").loc[2, "title"] == "t2 modifié"
+
+
+def test_diff_events(make_events):
+    old = make_events([1, 2, 3])
+    new = make_events([2, 3, 4], changed=[3])
+    assert diff_events(old, new) == {"added": [4], "removed": [1], "changed": [3]}
+
+
+def test_csv_migration(tmp_path, make_events):
+    make_events([2, 1]).to_csv(tmp_path / "events.csv", index=False)
+    df = load_events(tmp_path, "events")
+    assert (tmp_path / "events.parquet").exists()
+    assert df["id"].tolist() == [1, 2]
+    assert isinstance(df["date_end"].dtype, pd.DatetimeTZDtype)
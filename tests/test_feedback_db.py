@@ -0,0 +1,62 @@
+from sqlalchemy import inspect, text
+from utils import feedback_db
+from utils.feedback_writer import build_row
+
+
+def _reset_db():
+    feedback_db.Base.metadata.drop_all(feedback_db.engine)
+    feedback_db._initialized = False
+
+
+def test_init_db_migrates_legacy_schema():
+    _reset_db()
+    with feedback_db.engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS feedback_users"))
+        conn.execute(text("""CREATE TABLE feedback_users (id INTEGER PRIMARY KEY, question TEXT NOT NULL,
+                             answer TEXT, sources TEXT, feedback VARCHAR(20), feedback_value INTEGER,
+                             timestamp DATETIME, comment TEXT)"""))
+        conn.execute(text("""INSERT INTO feedback_users (question, feedback, feedback_value, timestamp)
+                             VALUES ('q', 'positive', 1, '2026-01-01 10:00:00')"""))
+
+    feedback_db.init_db()
+    columns = {col["name"] for col in inspect(feedback_db.engine).get_columns("feedback_users")}
+    assert {"model_size", "ab_arm"} <= columns
+    analytics = feedback_db.get_feedback_analytics(days=100000)
+    assert analytics["per_model"] == [{"model_size": "unknown", "positive": 1, "negative": 0, "satisfaction": 1.0}]
+
+
+def test_insert_rows_updates_rollups():
+    _reset_db()
+    feedback_db.init_db()
+    rows = [build_row("q", "a", "", "positive", 1, model_size="small", source_ids=["1", "2"], ab_arm="priors"),
+            build_row("q", "a", "", "negative", 0, model_size="small", source_ids=["1"], ab_arm="control")]
+    db = feedback_db.SessionLocal()
+    try:
+        feedback_db.insert_feedback_rows(db, rows)
+        db.commit()
+    finally:
+        db.close()
+
+    analytics = feedback_db.get_feedback_analytics()
+    assert {row["ab_arm"]: row["positive"] for row in analytics["per_ab_arm"]} == {"priors": 1, "control": 0}
+    negative = {row["event_id"]: row["negative"] for row in analytics["most_negative_events"]}
+    assert negative["1"] == 1
+
+
+def test_served_counts_persisted_per_arm():
+    _reset_db()
+    feedback_db.init_db()
+    db = feedback_db.SessionLocal()
+    try:
+        feedback_db.add_served_counts(db, {"priors": 3, "control": 2})
+        feedback_db.insert_feedback_rows(db, [build_row("q", "a", "", "positive", 1, ab_arm="priors")])
+        db.commit()
+    finally:
+        db.close()
+    # le recalcul complet des rollups conserve les réponses servies
+    feedback_db.rebuild_rollups()
+
+    per_arm = {row["ab_arm"]: row for row in feedback_db.get_feedback_analytics()["per_ab_arm"]}
+    assert (per_arm["priors"]["served"], per_arm["priors"]["positive"]) == (3, 1)
+    assert per_arm["priors"]["feedback_rate"] == round(1 / 3, 3)
+    assert (per_arm["control"]["served"], per_arm["control"]["feedback_rate"]) == (2, 0.0)
@@ -0,0 +1,70 @@
+import os
+import numpy as np
+from langchain_core.documents import Document
+from src.geo_index import GeoIndex, GEO_FILE, haversine_km, load_or_build_geo_index
+
+BASTILLE = (48.8532, 2.3692)
+
+
+def _offset(km_north, lat=BASTILLE[0], lon=BASTILLE[1]):
+    return lat + km_north / 111.195, lon
+
+
+class FakeStore:
+    """Vectorstore minimal : index.ntotal, index_to_docstore_id et docstore.search."""
+
+    def __init__(self, metadatas):
+        self.docs = {str(i): Document(page_content=str(i), metadata=m) for i, m in enumerate(metadatas)}
+        self.index_to_docstore_id = {i: str(i) for i in range(len(metadatas))}
+        self.index = type("Index", (), {"ntotal": len(metadatas)})()
+        self.docstore = type("Docstore", (), {"search": staticmethod(self.docs.get)})()
+
+
+def test_query_radius_edges():
+    lats, lons = zip(_offset(0.5), _offset(0.99), _offset(1.01), _offset(-0.99), _offset(5))
+    geo = GeoIndex.from_coordinates(lats, lons, cell_deg=0.005)
+    assert sorted(geo.query(*BASTILLE, 1.0).tolist()) == [0, 1, 3]
+    assert haversine_km(*BASTILLE, np.array(lats), np.array(lons))[2] > 1.0
+
+
+def test_query_empty_cells_and_missing_coordinates():
+    geo = GeoIndex.from_coordinates([BASTILLE[0], np.nan, None], [BASTILLE[1], 2.35, None])
+    assert geo.size == 3
+    assert geo.query(*BASTILLE, 1).tolist() == [0]
+    assert geo.query(43.2965, 5.3698, 10).tolist() == []          # Marseille : aucune cellule
+    empty = GeoIndex.from_coordinates([np.nan], [np.nan])
+    assert empty.query(*BASTILLE, 50).tolist() == []
+
+
+def test_shared_chunk_found_near_every_event():
+    near_saint_denis = (48.93, 2.35)
+    events = [{"id": 1, "latitude": BASTILLE[0], "longitude": BASTILLE[1]},
+              {"id": 8, "latitude": near_saint_denis[0], "longitude": near_saint_denis[1]}]
+    store = FakeStore([{**events[0], "event_ids": [1, 8], "events": events},
+                       {"id": 2, "latitude": BASTILLE[0], "longitude": BASTILLE[1]}])
+    geo = GeoIndex.from_vectorstore(store)
+    assert geo.query(*near_saint_denis, 1).tolist() == [0]
+    assert geo.query(*BASTILLE, 1).tolist() == [0, 1]
+
+
+def test_load_or_build_staleness(tmp_path):
+    index_file = tmp_path / "index.faiss"
+    index_file.write_bytes(b"")
+    store = FakeStore([{"id": 1, "latitude": BASTILLE[0], "longitude": BASTILLE[1]}])
+
+    built = load_or_build_geo_index(store, str(tmp_path))
+    assert (tmp_path / GEO_FILE).exists()
+    assert load_or_build_geo_index(store, str(tmp_path)).query(*BASTILLE, 1).tolist() == [0]
+
+    # index FAISS plus récent que geo.npz : reconstruction
+    grown = FakeStore([{"id": 1, "latitude": BASTILLE[0], "longitude": BASTILLE[1]},
+                       {"id": 2, "latitude": BASTILLE[0], "longitude": BASTILLE[1]}])
+    mtime = os.stat(tmp_path / GEO_FILE).st_mtime
+    os.utime(index_file, (mtime + 10, mtime + 10))
+    assert load_or_build_geo_index(grown, str(tmp_path)).query(*BASTILLE, 1).tolist() == [0, 1]
+
+    # geo.npz plus récent mais nombre de vecteurs différent : reconstruction aussi
+    os.utime(index_file, (0, 0))
+    assert GeoIndex.load(str(tmp_path)).size == 2
+    assert load_or_build_geo_index(store, str(tmp_path)).size == 1
+    assert built.size == 1
@@ -0,0 +1,70 @@
+from src import pipeline
+from src.embedding import data_to_embeddings, update_embeddings
+from src.event_store import load_events, save_events
+from src.shards import read_manifest, shard_dir
+from src.vectorsearch import load_vectorDB
+
+
+def _chunks(persist_dir):
+    db = load_vectorDB(persist_dir)
+    return [db.docstore.search(docstore_id) for docstore_id in db.index_to_docstore_id.values()]
+
+
+def _shared(persist_dir, footer):
+    return next(doc for doc in _chunks(persist_dir) if doc.page_content == footer)
+
+
+def test_update_embeddings_rebuilds_event_metadata(tmp_path, fake_embeddings, make_events, footer):
+    data_to_embeddings(make_events(range(1, 9)), str(tmp_path), chunk_size=150, chunk_overlap=0)
+    assert _shared(tmp_path, footer).metadata["event_ids"] == list(range(1, 9))
+
+    # événements 1 à 4 supprimés, 5 modifié, 9 ajouté
+    stats = update_embeddings(make_events([5, 9], changed=[5]), [1, 2, 3, 4], str(tmp_path),
+                              chunk_size=150, chunk_overlap=0)
+    assert stats["added"] > 0 and stats["deleted"] > 0
+
+    metadata = _shared(tmp_path, footer).metadata
+    assert sorted(metadata["event_ids"]) == [5, 6, 7, 8, 9]
+    assert (metadata["id"], metadata["title"], metadata["city"]) == (6, "t6", "ville6")
+    assert metadata["latitude"] == make_events([6])["latitude"][0]
+    assert {event["id"]: event["title"] for event in metadata["events"]} \
+        == {5: "t5 modifié", 6: "t6", 7: "t7", 8: "t8", 9: "t9"}
+
+    texts = [doc.page_content for doc in _chunks(tmp_path)]
+    assert not any("événement 1." in text for text in texts)
+    assert any("Événement 5 modifié" in text for text in texts)
+    assert not any("Événement 5 initial" in text for text in texts)
+
+
+def test_incremental_update(tmp_path, fake_embeddings, monkeypatch, make_events):
+    data_dir, root, agenda = str(tmp_path / "data"), str(tmp_path / "vectorDB"), "42"
+    save_events(make_events([1, 2, 3]), data_dir, "events_42")
+    pipeline.build_index(data_dir, "events", root, agenda)
+
+    monkeypatch.setattr(pipeline, "fetch_openagenda_events", lambda agenda_uid: make_events([2, 3, 4], changed=[3]))
+    result = pipeline.incremental_update(data_dir, "events", root, agenda)
+
+    assert (result["added"], result["changed"], result["removed"]) == (1, 1, 1)
+    assert result["chunks_added"] > 0 and result["chunks_deleted"] > 0
+    assert result["version"] == 2 == read_manifest(shard_dir(root, agenda))["version"]
+    assert load_events(data_dir, "events_42")["id"].tolist() == [2, 3, 4]
+    ids = {event_id for doc in _chunks(shard_dir(root, agenda)) for event_id in doc.metadata["event_ids"]}
+    assert ids == {2, 3, 4}
+
+
+def test_failed_build_leaves_no_manifest(tmp_path, monkeypatch, make_events):
+    data_dir, root = str(tmp_path / "data"), str(tmp_path / "vectorDB")
+    monkeypatch.setattr(pipeline, "compute_event_priors", lambda root: 0)
+
+    # aucune donnée pour l'agenda
+    assert pipeline.build_shards(data_dir, "events", root, ["42"]) == []
+    assert read_manifest(shard_dir(root, "42")) == {}
+
+    # modèle d'embeddings indisponible
+    def no_model():
+        raise OSError("modèle introuvable")
+
+    monkeypatch.setattr("src.embedding.get_embeddings", no_model)
+    save_events(make_events([1, 2]), data_dir, "events_42")
+    assert pipeline.build_index(data_dir, "events", root, "42") is None
+    assert read_manifest(shard_dir(root, "42")) == {}
@@ -0,0 +1,35 @@
+import os
+import numpy as np
+import pytest
+from src import priors
+from src.priors import load_event_priors, PRIORS_FILE
+from utils.file_utils import atomic_write
+
+
+def _save_priors(path, prior):
+    with atomic_write(path / PRIORS_FILE) as f:
+        np.savez(f, event_ids=np.array(["1"]), prior=np.array([prior], dtype=np.float32))
+
+
+def test_atomic_write_keeps_previous_file_on_error(tmp_path):
+    _save_priors(tmp_path, 0.5)
+    with pytest.raises(RuntimeError):
+        with atomic_write(tmp_path / PRIORS_FILE) as f:
+            f.write(b"PK\x03\x04")
+            raise RuntimeError("écriture interrompue")
+    assert os.listdir(tmp_path) == [PRIORS_FILE]
+    with np.load(tmp_path / PRIORS_FILE) as data:
+        assert data["prior"].tolist() == [0.5]
+
+
+def test_unreadable_priors_do_not_break_search(tmp_path, monkeypatch):
+    monkeypatch.setattr(priors, "_cache", {})
+    (tmp_path / PRIORS_FILE).write_bytes(b"PK\x03\x04")
+    assert load_event_priors(str(tmp_path)) == {}
+
+    _save_priors(tmp_path, 0.5)
+    assert load_event_priors(str(tmp_path)) == {"1": 0.5}
+    # fichier illisible plus récent : les priors précédents restent servis
+    (tmp_path / PRIORS_FILE).write_bytes(b"PK\x03\x04")
+    os.utime(tmp_path / PRIORS_FILE, (2e9, 2e9))
+    assert load_event_priors(str(tmp_path)) == {"1": 0.5}
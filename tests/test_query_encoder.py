@@ -0,0 +1,104 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from src.query_encoder import QueryEncoder, normalize_query
+
+
+class FakeModel:
+    """embed_documents factice : compte les appels et la taille de chaque lot."""
+
+    def __init__(self, delay=0.02, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.batches.append(list(texts))
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("modèle indisponible")
+        return [[float(len(text))] for text in texts]
+
+
+def _encode_concurrently(encoder, texts):
+    with ThreadPoolExecutor(len(texts)) as pool:
+        return list(pool.map(encoder.encode, texts))
+
+
+def test_concurrent_misses_coalesce_into_one_call():
+    model = FakeModel()
+    encoder = QueryEncoder(model, batch_window_ms=50, max_batch=32)
+    texts = [f"question {i}" for i in range(8)]
+    assert _encode_concurrently(encoder, texts) == [[float(len(text))] for text in texts]
+    assert len(model.batches) == 1
+    assert sorted(model.batches[0]) == sorted(texts)
+    assert encoder.stats()["max_batch_size"] == 8
+
+
+def test_duplicate_keys_share_one_encoding():
+    model = FakeModel()
+    encoder = QueryEncoder(model, batch_window_ms=50)
+    results = _encode_concurrently(encoder, ["Concert  Jazz", "concert jazz", "CONCERT JAZZ "])
+    assert results == [[12.0]] * 3
+    assert model.batches == [["concert jazz"]]
+    assert normalize_query("  Concert\tJAZZ ") == "concert jazz"
+
+
+def test_cache_respects_size_and_lru_order():
+    model = FakeModel(delay=0)
+    encoder = QueryEncoder(model, cache_size=2, batch_window_ms=0)
+    encoder.encode("a")
+    encoder.encode("b")
+    encoder.encode("a")          # hit : "a" devient le plus récent
+    encoder.encode("c")          # évince "b"
+    assert list(encoder._cache) == ["a", "c"]
+    assert (encoder.hits, encoder.misses) == (1, 3)
+
+    encoder.encode("b")
+    assert model.batches[-1] == ["b"]
+
+
+def test_batches_split_at_max_batch():
+    model = FakeModel()
+    encoder = QueryEncoder(model, batch_window_ms=50, max_batch=3)
+    _encode_concurrently(encoder, [f"q{i}" for i in range(7)])
+    assert [len(batch) for batch in model.batches] == [3, 3, 1]
+
+
+def test_error_reaches_every_waiter():
+    model = FakeModel(fail=True)
+    encoder = QueryEncoder(model, batch_window_ms=50)
+
+    def encode(text):
+        with pytest.raises(RuntimeError):
+            encoder.encode(text)
+        return True
+
+    with ThreadPoolExecutor(4) as pool:
+        assert all(pool.map(encode, ["a", "b", "a", "c"]))
+    assert encoder._leader is False
+    assert encoder._pending == {}
+
+    # l'encodeur reste utilisable une fois le modèle rétabli
+    model.fail = False
+    assert encoder.encode("a") == [1.0]
+
+
+def test_batch_uses_query_encode_kwargs():
+    class FakeHuggingFace:
+        encode_kwargs = {}
+        query_encode_kwargs = {"prompt": "query: "}
+
+        def __init__(self):
+            self.calls = []
+
+        def _embed(self, texts, encode_kwargs):
+            self.calls.append((list(texts), encode_kwargs))
+            return [[1.0] for _ in texts]
+
+    model = FakeHuggingFace()
+    assert _encode_concurrently(QueryEncoder(model, batch_window_ms=50), ["a", "b"]) == [[1.0], [1.0]]
+    assert model.calls == [(["a", "b"], {"prompt": "query: "})]
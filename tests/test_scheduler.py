@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+import pytest
+from src.scheduler import Lane, RequestScheduler, SchedulerRejection
+
+
+def _scheduler(max_concurrency=1, max_queue=10, rate_per_minute=6000, burst=100):
+    return RequestScheduler({"small": Lane("small", max_concurrency, max_queue)},
+                            rate_per_minute=rate_per_minute, burst=burst, queue_timeout=5)
+
+
+class Work:
+    """Fonction bloquante qui mesure le nombre d'appels simultanés."""
+
+    def __init__(self, duration=0.05):
+        self.duration = duration
+        self.running = 0
+        self.peak = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(self.duration)
+        with self._lock:
+            self.running -= 1
+        return "ok"
+
+
+def test_cancelled_request_keeps_its_slot():
+    async def scenario():
+        sched, work = _scheduler(), Work()
+        lane = sched.lanes["small"]
+        first = asyncio.create_task(sched.submit("small", "key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()                      # client déconnecté pendant l'appel au LLM
+        results = await asyncio.gather(*(sched.submit("small", "key", work) for _ in range(3)))
+
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        while lane.in_flight:
+            await asyncio.sleep(0.01)
+        return results, work, lane
+
+    results, work, lane = asyncio.run(scenario())
+    assert results == ["ok"] * 3
+    assert work.peak == 1
+    assert work.calls == 4
+    assert lane.completed == 4              # le thread annulé côté client a bien terminé
+    assert lane.failed == 0
+
+
+def test_failed_call_not_counted_as_completed():
+    def boom():
+        raise ValueError("boom")
+
+    async def scenario():
+        sched = _scheduler()
+        with pytest.raises(ValueError):
+            await sched.submit("small", "key", boom)
+        return sched.lanes["small"]
+
+    lane = asyncio.run(scenario())
+    assert (lane.completed, lane.failed, lane.in_flight) == (0, 1, 0)
+
+
+def test_queue_full_and_rate_limit():
+    async def scenario():
+        sched, work = _scheduler(max_queue=0), Work(0.1)
+        running = asyncio.create_task(sched.submit("small", "key", work))
+        await asyncio.sleep(0.01)
+        with pytest.raises(SchedulerRejection) as full:
+            await sched.submit("small", "key", work)
+        await running
+
+        limited = _scheduler(rate_per_minute=1, burst=1)
+        await limited.submit("small", "key", work)
+        with pytest.raises(SchedulerRejection) as rate:
+            await limited.submit("small", "key", work)
+        return full.value, rate.value
+
+    full, rate = asyncio.run(scenario())
+    assert full.reason == "queue_full"
+    assert rate.reason == "rate_limited" and rate.retry_after >= 1
@@ -0,0 +1,117 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from src import shards, vectorsearch, geo_index
+from src.shards import ShardManager, search_shards, write_manifest, shard_dir
+
+
+def _make_shards(root, sizes):
+    """Shards factices : seul index.faiss existe, avec la taille (octets) demandée."""
+    for agenda_uid, size in sizes.items():
+        path = root / agenda_uid
+        path.mkdir(parents=True)
+        (path / "index.faiss").write_bytes(b"\0" * size)
+
+
+@pytest.fixture
+def fake_loading(monkeypatch):
+    """get_vectorDB / invalidate_cache factices : le « db » d'un shard est son dossier."""
+    loaded, unloaded = [], []
+
+    def get_vectorDB(persist_dir):
+        loaded.append(persist_dir)
+        return persist_dir, None, None
+
+    monkeypatch.setattr(shards, "get_vectorDB", get_vectorDB)
+    monkeypatch.setattr(shards, "invalidate_cache", unloaded.append)
+    return loaded, unloaded
+
+
+def test_lru_eviction_under_memory_budget(tmp_path, fake_loading):
+    _, unloaded = fake_loading
+    mb = 2 ** 20
+    _make_shards(tmp_path, {"a": mb, "b": mb, "c": mb})
+    manager = ShardManager(str(tmp_path), ["a", "b", "c"], memory_budget_mb=2.5, workers=1)
+
+    manager.acquire("a")
+    manager.acquire("b")
+    manager.acquire("a")            # "a" redevient le plus récent
+    manager.acquire("c")            # 3 Mo > 2,5 Mo : "b" (le moins récent) est déchargé
+    assert manager.stats()["loaded"] == ["a", "c"]
+    assert unloaded == [shard_dir(str(tmp_path), "b")]
+    assert (manager.loads, manager.unloads) == (3, 1)
+
+    # un shard plus gros que le budget reste chargé tant qu'il est le seul
+    big = ShardManager(str(tmp_path), ["a"], memory_budget_mb=0.5, workers=1)
+    big.acquire("a")
+    assert big.stats()["loaded"] == ["a"]
+
+
+def test_relevant_filters_agendas_and_bbox(tmp_path):
+    _make_shards(tmp_path, {"paris": 1, "marseille": 1, "sans_coord": 1})
+    write_manifest(shard_dir(str(tmp_path), "paris"), "paris", bbox=[48.80, 48.90, 2.25, 2.42])
+    write_manifest(shard_dir(str(tmp_path), "marseille"), "marseille", bbox=[43.20, 43.40, 5.30, 5.50])
+    manager = ShardManager(str(tmp_path), ["paris", "marseille", "sans_coord", "absent"], workers=1)
+
+    assert manager.available() == ["paris", "marseille", "sans_coord"]
+    assert manager.relevant(agendas=["marseille", "absent"]) == ["marseille"]
+    assert manager.relevant(near=(48.85, 2.35, 3)) == ["paris", "sans_coord"]
+    # juste hors de l'emprise, mais dans le rayon : le shard reste interrogé
+    assert "paris" in manager.relevant(near=(48.92, 2.35, 3))
+    assert "paris" not in manager.relevant(near=(48.95, 2.35, 3))
+
+
+def test_search_shards_merges_by_score_and_unions_events(tmp_path, fake_loading, monkeypatch):
+    _make_shards(tmp_path, {"a": 1, "b": 1})
+    root = str(tmp_path)
+
+    def doc(text, event_id):
+        return Document(page_content=text, metadata={"id": event_id, "title": f"t{event_id}"})
+
+    shared_a, shared_b = doc("pied de page", 1), doc("pied de page", 2)
+    per_shard = {
+        shard_dir(root, "a"): [(doc("a1", 10), 0.9), (shared_a, 0.5), (doc("a2", 11), 0.3)],
+        shard_dir(root, "b"): [(doc("b1", 20), 0.8), (shared_b, 0.6)],
+    }
+    monkeypatch.setattr(shards, "candidates", lambda db, expiry, geo, query, k, near: per_shard[db])
+    monkeypatch.setitem(shards._managers, root, ShardManager(root, ["a", "b"], workers=2))
+
+    results = search_shards("question", root, top_k=4, use_priors=False)
+    assert [d.page_content for d in results] == ["a1", "b1", "pied de page", "a2"]
+
+    merged = results[2].metadata
+    assert merged["event_ids"] == [2, 1]                      # meilleure pertinence (shard b) en premier
+    assert (merged["id"], merged["title"]) == (2, "t2")
+    assert "events" not in shared_a.metadata and "events" not in shared_b.metadata   # docstore intact
+
+    assert [d.page_content for d in search_shards("question", root, top_k=5, agendas=["a"], use_priors=False)] \
+        == ["a1", "pied de page", "a2"]
+
+
+def test_shard_load_does_not_block_other_shards(tmp_path, monkeypatch):
+    _make_shards(tmp_path, {"lent": 1, "rapide": 1, "autre": 1})
+    started, release = threading.Event(), threading.Event()
+
+    def load_vectorDB(persist_dir):
+        if persist_dir.endswith("lent"):
+            started.set()
+            release.wait(5)
+        return persist_dir
+
+    monkeypatch.setattr(vectorsearch, "load_vectorDB", load_vectorDB)
+    monkeypatch.setattr(vectorsearch, "build_expiry_array", lambda db: np.array([]))
+    monkeypatch.setattr(geo_index, "load_or_build_geo_index", lambda db, persist_dir: None)
+    monkeypatch.setattr(vectorsearch, "_cache", {})
+    rapide, lent, autre = (shard_dir(str(tmp_path), uid) for uid in ("rapide", "lent", "autre"))
+    vectorsearch.get_vectorDB(rapide)
+
+    with ThreadPoolExecutor(3) as pool:
+        slow = pool.submit(vectorsearch.get_vectorDB, lent)
+        assert started.wait(5)
+        # pendant le chargement de « lent » : hit sur « rapide » et chargement de « autre » immédiats
+        assert pool.submit(vectorsearch.get_vectorDB, rapide).result(timeout=1)[0] == rapide
+        assert pool.submit(vectorsearch.get_vectorDB, autre).result(timeout=1)[0] == autre
+        release.set()
+        assert slow.result(timeout=5)[0] == lent
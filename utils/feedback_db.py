@@ -1,9 +1,13 @@
 import os
 import datetime
 import logging
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, text
-from sqlalchemy.orm import sessionmaker, declarative_base
+import threading
+from collections import defaultdict
+from sqlalchemy import create_engine, event, inspect, Column, Integer, String, Text, Date, DateTime, ForeignKey, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import sessionmaker, declarative_base, relationship
 from sqlalchemy.exc import SQLAlchemyError
+from utils.feedback_writer import validate_feedback, build_row
 
 # ----------------------------------------------------------------------------
 # LOGGING
@@ -15,16 +19,27 @@ logging.basicConfig(
 
 # ----------------------------------------------------------------------------
 # CONFIG BDD
-DATABASE_DIR = "data"
+DATABASE_DIR = os.getenv("FEEDBACK_DB_DIR", "data")
 os.makedirs(DATABASE_DIR, exist_ok=True)
 DATABASE_URL = f"sqlite:///{DATABASE_DIR}/feedback.db"
 
+# Engine unique partagé par l'API (et toute autre partie du projet)
 engine = create_engine(
     DATABASE_URL,
     connect_args={"check_same_thread": False},
     echo=False
 )
 
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL : les lectures ne bloquent plus l'écriture (et inversement)
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
 Base = declarative_base()
 
 # ----------------------------------------------------------------------------
@@ -38,46 +53,258 @@ class Feedback(Base):
     sources = Column(Text)
     feedback = Column(String(20))        # "positive" / "negative"
     feedback_value = Column(Integer)     # 1 = positif, 0 = négatif
-    timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.datetime.utcnow, index=True)
     comment = Column(Text)
+    model_size = Column(String(10), index=True)   # "small" / "large"
+    ab_arm = Column(String(10))                    # "control" / "priors"
+
+    event_refs = relationship("FeedbackSource", cascade="all, delete-orphan")
+
+# ----------------------------------------------------------------------------
+# TABLE DES SOURCES (références structurées vers les événements)
+class FeedbackSource(Base):
+    __tablename__ = "feedback_sources"
+
+    feedback_id = Column(Integer, ForeignKey("feedback_users.id"), primary_key=True)
+    event_id = Column(String(32), primary_key=True, index=True)
 
 # ----------------------------------------------------------------------------
-# CRÉATION DES TABLES (ne modifie pas les tables existantes)
-try:
-    Base.metadata.create_all(engine)
-    logging.info("Base et tables initialisées (create_all exécuté)")
-except SQLAlchemyError as e:
-    logging.exception("Erreur lors de la création des tables")
+# ROLLUPS (mis à jour incrémentalement, dans la même transaction que l'insert)
+class FeedbackEventRollup(Base):
+    __tablename__ = "feedback_rollup_event"
+
+    event_id = Column(String(32), primary_key=True)
+    positive = Column(Integer, nullable=False, default=0, index=True)
+    negative = Column(Integer, nullable=False, default=0, index=True)
+    last_feedback = Column(DateTime)
+
+
+class FeedbackDayRollup(Base):
+    __tablename__ = "feedback_rollup_day"
+
+    day = Column(Date, primary_key=True)
+    positive = Column(Integer, nullable=False, default=0)
+    negative = Column(Integer, nullable=False, default=0)
+
+
+class FeedbackModelRollup(Base):
+    __tablename__ = "feedback_rollup_model"
+
+    model_size = Column(String(10), primary_key=True)
+    positive = Column(Integer, nullable=False, default=0)
+    negative = Column(Integer, nullable=False, default=0)
+
+
+class FeedbackArmRollup(Base):
+    __tablename__ = "feedback_rollup_arm"
+
+    ab_arm = Column(String(10), primary_key=True)
+    positive = Column(Integer, nullable=False, default=0)
+    negative = Column(Integer, nullable=False, default=0)
+    served = Column(Integer, nullable=False, default=0, server_default="0")   # réponses /chat réussies
 
 # ----------------------------------------------------------------------------
 # SESSION
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# ----------------------------------------------------------------------------
+# MIGRATION LÉGÈRE (bases créées avant l'ajout de model_size, ab_arm, des rollups et de served)
+def _ensure_schema():
+    columns = {col["name"] for col in inspect(engine).get_columns("feedback_users")}
+    arm_columns = {col["name"] for col in inspect(engine).get_columns("feedback_rollup_arm")}
+    with engine.begin() as conn:
+        if "served" not in arm_columns:
+            conn.execute(text("ALTER TABLE feedback_rollup_arm ADD COLUMN served INTEGER NOT NULL DEFAULT 0"))
+            logging.info("Colonne served ajoutée à feedback_rollup_arm")
+        if "model_size" not in columns:
+            conn.execute(text("ALTER TABLE feedback_users ADD COLUMN model_size VARCHAR(10)"))
+            logging.info("Colonne model_size ajoutée à feedback_users")
+        if "ab_arm" not in columns:
+            conn.execute(text("ALTER TABLE feedback_users ADD COLUMN ab_arm VARCHAR(10)"))
+            logging.info("Colonne ab_arm ajoutée à feedback_users")
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_feedback_users_timestamp ON feedback_users (timestamp)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_feedback_users_model_size ON feedback_users (model_size)"))
+
+        has_rows = conn.execute(text("SELECT 1 FROM feedback_users LIMIT 1")).first()
+        has_rollups = conn.execute(text("SELECT 1 FROM feedback_rollup_day LIMIT 1")).first()
+    if has_rows and not has_rollups:
+        rebuild_rollups()
+
+
+# ----------------------------------------------------------------------------
+# INITIALISATION EXPLICITE (démarrage de l'API, CLI, premier lot écrit)
+# rien n'est écrit dans la base au simple import du module
+_initialized = False
+_init_lock = threading.Lock()
+
+
+def init_db():
+    """Crée les tables manquantes et migre le schéma (une seule fois par processus)."""
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        try:
+            Base.metadata.create_all(engine)
+            _ensure_schema()
+            _initialized = True
+            logging.info("Base et tables initialisées (create_all + migration)")
+        except SQLAlchemyError:
+            logging.exception("Erreur lors de l'initialisation de la base feedback")
+
+
+def rebuild_rollups():
+    """
+    Recalcule entièrement les rollups à partir des tables brutes
+    (scan complet : à réserver à la migration ou à une réparation manuelle).
+    Le nombre de réponses servies par groupe A/B n'existe que dans le rollup : il est conservé.
+    """
+    statements = [
+        "DELETE FROM feedback_rollup_event",
+        "DELETE FROM feedback_rollup_day",
+        "DELETE FROM feedback_rollup_model",
+        "UPDATE feedback_rollup_arm SET positive = 0, negative = 0",
+        """INSERT INTO feedback_rollup_event (event_id, positive, negative, last_feedback)
+           SELECT s.event_id, SUM(f.feedback_value = 1), SUM(f.feedback_value = 0), MAX(f.timestamp)
+           FROM feedback_sources s JOIN feedback_users f ON f.id = s.feedback_id
+           GROUP BY s.event_id""",
+        """INSERT INTO feedback_rollup_day (day, positive, negative)
+           SELECT date(timestamp), SUM(feedback_value = 1), SUM(feedback_value = 0)
+           FROM feedback_users WHERE timestamp IS NOT NULL GROUP BY date(timestamp)""",
+        """INSERT INTO feedback_rollup_model (model_size, positive, negative)
+           SELECT COALESCE(model_size, 'unknown'), SUM(feedback_value = 1), SUM(feedback_value = 0)
+           FROM feedback_users GROUP BY COALESCE(model_size, 'unknown')""",
+        """INSERT INTO feedback_rollup_arm (ab_arm, positive, negative)
+           SELECT COALESCE(ab_arm, 'unknown'), SUM(feedback_value = 1), SUM(feedback_value = 0)
+           FROM feedback_users WHERE true GROUP BY COALESCE(ab_arm, 'unknown')
+           ON CONFLICT (ab_arm) DO UPDATE SET positive = excluded.positive, negative = excluded.negative""",
+    ]
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+    logging.info("Rollups de feedback recalculés")
+
+
+# ----------------------------------------------------------------------------
+# INSERTION PAR LOT + ROLLUPS
+def _upsert_counts(db, table, key, counts, last_seen=None):
+    """INSERT ... ON CONFLICT DO UPDATE : ajoute les compteurs du lot aux rollups."""
+    if not counts:
+        return
+    values = []
+    for k, (pos, neg) in counts.items():
+        value = {key: k, "positive": pos, "negative": neg}
+        if last_seen is not None:
+            value["last_feedback"] = last_seen[k]
+        values.append(value)
+    stmt = sqlite_insert(table).values(values)
+    updates = {
+        "positive": table.c.positive + stmt.excluded.positive,
+        "negative": table.c.negative + stmt.excluded.negative,
+    }
+    if last_seen is not None:
+        updates["last_feedback"] = stmt.excluded.last_feedback
+    db.execute(stmt.on_conflict_do_update(index_elements=[key], set_=updates))
+
+
+def insert_feedback_rows(db, rows):
+    """Insère un lot de feedbacks, leurs sources et met à jour les rollups."""
+    by_event, by_day = defaultdict(lambda: [0, 0]), defaultdict(lambda: [0, 0])
+    by_model, by_arm = defaultdict(lambda: [0, 0]), defaultdict(lambda: [0, 0])
+    last_seen = {}
+    entries = []
+    for row in rows:
+        row = dict(row)
+        source_ids = row.pop("source_ids", [])
+        entry = Feedback(**row)
+        entry.event_refs = [FeedbackSource(event_id=event_id) for event_id in source_ids]
+        entries.append(entry)
+
+        slot = 0 if row["feedback_value"] == 1 else 1
+        for event_id in source_ids:
+            by_event[event_id][slot] += 1
+            last_seen[event_id] = max(last_seen.get(event_id, row["timestamp"]), row["timestamp"])
+        by_day[row["timestamp"].date()][slot] += 1
+        by_model[row["model_size"] or "unknown"][slot] += 1
+        by_arm[row["ab_arm"] or "unknown"][slot] += 1
+
+    db.add_all(entries)
+    db.flush()
+    _upsert_counts(db, FeedbackEventRollup.__table__, "event_id", by_event, last_seen)
+    _upsert_counts(db, FeedbackDayRollup.__table__, "day", by_day)
+    _upsert_counts(db, FeedbackModelRollup.__table__, "model_size", by_model)
+    _upsert_counts(db, FeedbackArmRollup.__table__, "ab_arm", by_arm)
+
+
+def add_served_counts(db, served):
+    """Ajoute au rollup par groupe A/B le nombre de réponses /chat servies ({ab_arm: n})."""
+    if not served:
+        return
+    table = FeedbackArmRollup.__table__
+    stmt = sqlite_insert(table).values([{"ab_arm": arm, "positive": 0, "negative": 0, "served": count}
+                                        for arm, count in served.items()])
+    db.execute(stmt.on_conflict_do_update(index_elements=["ab_arm"],
+                                          set_={"served": table.c.served + stmt.excluded.served}))
+
+# ----------------------------------------------------------------------------
+# ANALYTICS (lecture des rollups uniquement, jamais de scan de feedback_users)
+def _ratio(pos, neg):
+    total = pos + neg
+    return round(pos / total, 3) if total else None
+
+
+def get_feedback_analytics(limit=10, days=30):
+    init_db()
+    db = SessionLocal()
+    try:
+        since = datetime.date.today() - datetime.timedelta(days=days)
+        worst = (db.query(FeedbackEventRollup)
+                   .order_by(FeedbackEventRollup.negative.desc())
+                   .limit(limit).all())
+        best = (db.query(FeedbackEventRollup)
+                  .order_by(FeedbackEventRollup.positive.desc())
+                  .limit(limit).all())
+        per_day = (db.query(FeedbackDayRollup)
+                     .filter(FeedbackDayRollup.day >= since)
+                     .order_by(FeedbackDayRollup.day).all())
+        per_model = db.query(FeedbackModelRollup).all()
+        per_arm = db.query(FeedbackArmRollup).all()
+
+        def event_row(r):
+            return {"event_id": r.event_id, "positive": r.positive, "negative": r.negative,
+                    "satisfaction": _ratio(r.positive, r.negative)}
+
+        return {
+            "most_negative_events": [event_row(r) for r in worst],
+            "most_positive_events": [event_row(r) for r in best],
+            "per_day": [{"day": r.day.isoformat(), "positive": r.positive, "negative": r.negative,
+                         "satisfaction": _ratio(r.positive, r.negative)} for r in per_day],
+            "per_model": [{"model_size": r.model_size, "positive": r.positive, "negative": r.negative,
+                           "satisfaction": _ratio(r.positive, r.negative)} for r in per_model],
+            "per_ab_arm": [{"ab_arm": r.ab_arm, "positive": r.positive, "negative": r.negative,
+                            "satisfaction": _ratio(r.positive, r.negative), "served": r.served,
+                            "feedback_rate": round((r.positive + r.negative) / r.served, 3) if r.served else None}
+                           for r in per_arm],
+        }
+    finally:
+        db.close()
+
 # ----------------------------------------------------------------------------
 # FONCTION D'INSERT ROBUSTE
-def save_feedback_to_db(question, answer, sources, feedback_label, value, comment=None):
+def save_feedback_to_db(question, answer, sources, feedback_label, value, comment=None, model_size=None, source_ids=None,
+                        ab_arm=None):
     """
-    Enregistre un feedback dans la base.
+    Enregistre un feedback dans la base (écriture synchrone).
     Retourne True si OK, False sinon.
     """
-    if not question:
-        logging.warning("Tentative d'enregistrement avec question vide")
-        return False
-    if value not in (0, 1):
-        logging.warning("Valeur de feedback invalide: %s", value)
+    if not validate_feedback(question, value):
         return False
 
+    init_db()
     db = SessionLocal()
     try:
-        entry = Feedback(
-            question=question,
-            answer=answer,
-            sources=str(sources),
-            feedback=feedback_label,
-            feedback_value=value,
-            comment=comment
-        )
-        db.add(entry)
+        insert_feedback_rows(db, [build_row(question, answer, sources, feedback_label, value, comment, model_size,
+                                            source_ids, ab_arm)])
         db.commit()
         logging.info("Feedback inséré (question=%s, value=%s)", question[:50], value)
         return True
@@ -0,0 +1,188 @@
+import os
+import queue
+import datetime
+import logging
+import threading
+
+# ----------------------------------------------------------------------------
+# LOGGING
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    handlers=[logging.StreamHandler()]
+)
+
+# ----------------------------------------------------------------------------
+# CONFIG
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", "100"))
+FEEDBACK_FLUSH_INTERVAL_S = float(os.getenv("FEEDBACK_FLUSH_INTERVAL_S", "1.0"))
+# borne de la file en mémoire : au-delà, les feedbacks sont refusés (503) plutôt que bufferisés
+FEEDBACK_MAX_QUEUE = int(os.getenv("FEEDBACK_MAX_QUEUE", "10000"))
+
+
+class FeedbackQueueFull(Exception):
+    """La file des feedbacks en attente d'écriture est pleine."""
+
+# ----------------------------------------------------------------------------
+# VALIDATION
+def validate_feedback(question, value):
+    if not question:
+        logging.warning("Tentative d'enregistrement avec question vide")
+        return False
+    if value not in (0, 1):
+        logging.warning("Valeur de feedback invalide: %s", value)
+        return False
+    return True
+
+
+def build_row(question, answer, sources, feedback_label, value, comment=None, model_size=None, source_ids=None,
+              ab_arm=None):
+    return {
+        "question": question,
+        "answer": answer,
+        "sources": str(sources),
+        "feedback": feedback_label,
+        "feedback_value": value,
+        "comment": comment,
+        "model_size": model_size,
+        "ab_arm": ab_arm,
+        "timestamp": datetime.datetime.utcnow(),
+        "source_ids": sorted({str(event_id) for event_id in (source_ids or [])}),
+    }
+
+
+# ----------------------------------------------------------------------------
+# INGESTION ASYNCHRONE PAR LOTS
+class FeedbackWriter:
+    """
+    File d'attente en mémoire + thread d'arrière-plan qui insère les feedbacks
+    par lots (une transaction par lot) au lieu d'un commit par pouce levé.
+    """
+
+    def __init__(self, batch_size=FEEDBACK_BATCH_SIZE, flush_interval=FEEDBACK_FLUSH_INTERVAL_S,
+                 max_queue=FEEDBACK_MAX_QUEUE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.rejected = 0
+        self._served = {}           # réponses /chat servies par groupe A/B, pas encore écrites
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="feedback-writer", daemon=True)
+            self._thread.start()
+            logging.info("Thread d'écriture des feedbacks démarré")
+
+    def enqueue(self, question, answer, sources, feedback_label, value, comment=None, model_size=None, source_ids=None,
+                ab_arm=None):
+        """
+        Met un feedback en file. Retourne True si accepté, False si invalide.
+        Lève FeedbackQueueFull si la file est pleine (écriture en retard sur les entrées).
+        """
+        if not validate_feedback(question, value):
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait(build_row(question, answer, sources, feedback_label, value, comment, model_size,
+                                             source_ids, ab_arm))
+        except queue.Full:
+            self.rejected += 1
+            logging.warning("File des feedbacks pleine (%s), feedback refusé", self._queue.maxsize)
+            raise FeedbackQueueFull()
+        return True
+
+    def record_served(self, ab_arm):
+        """Compte une réponse /chat réussie pour son groupe A/B (écrite avec le prochain lot)."""
+        with self._lock:
+            self._served[ab_arm] = self._served.get(ab_arm, 0) + 1
+        self.start()
+
+    def _take_served(self):
+        with self._lock:
+            served, self._served = self._served, {}
+        return served
+
+    def _restore_served(self, served):
+        with self._lock:
+            for arm, count in served.items():
+                self._served[arm] = self._served.get(arm, 0) + count
+
+    def _drain(self, first):
+        rows = [first]
+        while len(rows) < self.batch_size:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _flush(self, rows):
+        """Écrit un lot de feedbacks et les compteurs de réponses servies, dans une seule transaction."""
+        served = self._take_served()
+        if not rows and not served:
+            return
+        # SQLAlchemy n'est chargé qu'au premier lot à écrire
+        from utils.feedback_db import SessionLocal, insert_feedback_rows, add_served_counts, init_db
+
+        init_db()
+        db = SessionLocal()
+        try:
+            if rows:
+                insert_feedback_rows(db, rows)
+            add_served_counts(db, served)
+            db.commit()
+            if rows:
+                self.written += len(rows)
+                self.batches += 1
+                logging.debug("%s feedbacks insérés en un lot", len(rows))
+        except Exception:
+            logging.exception("Erreur DB lors de l'insertion d'un lot de feedbacks")
+            self.failed += len(rows)
+            self._restore_served(served)
+            try:
+                db.rollback()
+            except Exception:
+                pass
+        finally:
+            try:
+                db.close()
+            except Exception:
+                pass
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._flush([])
+                continue
+            self._flush(self._drain(first))
+        self._flush([])
+
+    def stop(self, timeout=10):
+        """Vide la file puis arrête le thread (appelé à l'arrêt de l'API)."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            logging.info("Thread d'écriture des feedbacks arrêté")
+
+    def stats(self):
+        return {
+            "pending": self._queue.qsize(),
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "rejected": self.rejected,
+        }
+
+
+feedback_writer = FeedbackWriter()
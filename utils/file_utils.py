@@ -1,6 +1,9 @@
 import os
 import shutil
 import logging
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
 
 def delete_file(path):
     if os.path.exists(path):
@@ -11,3 +14,21 @@ def delete_folder(path):
     if os.path.exists(path):
         shutil.rmtree(path)
         logging.info(f"Dossier supprimé : {path}")
+
+
+@contextmanager
+def atomic_write(path, mode="wb", **kwargs):
+    """
+    Écrit dans un fichier temporaire du même dossier puis le renomme (os.replace) :
+    un lecteur concurrent voit l'ancien fichier ou le nouveau, jamais un fichier à moitié écrit.
+    """
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
@@ -1,6 +1,35 @@
-from pydantic import BaseModel, Field
+from typing import List, Optional
+from pydantic import BaseModel, Field, model_validator
+
+# nombre maximal d'événements sources d'une réponse (renvoyés par /chat, acceptés par /feedback)
+MAX_SOURCE_IDS = 50
 
 # definition du model de donnée pour les questions
 class QueryRequest(BaseModel):
     question : str = Field(description='Merci de mettre la question ici', max_length=500)
-    model_size: str = Field(description='Choix du model Small ou Large', pattern="^(small|large)$")
\ No newline at end of file
+    model_size: str = Field(description='Choix du model Small ou Large', pattern="^(small|large)$")
+    latitude: Optional[float] = Field(default=None, description='Latitude du point de recherche (optionnel)', ge=-90, le=90)
+    longitude: Optional[float] = Field(default=None, description='Longitude du point de recherche (optionnel)', ge=-180, le=180)
+    radius_km: float = Field(default=3.0, description='Rayon de recherche autour du point, en km', gt=0, le=500)
+    agendas: Optional[List[str]] = Field(default=None, description='Agendas interrogés (tous par défaut)', max_length=50)
+
+    @model_validator(mode="after")
+    def check_point(self):
+        if (self.latitude is None) != (self.longitude is None):
+            raise ValueError("latitude et longitude doivent être fournies ensemble")
+        return self
+
+    @property
+    def near(self):
+        return None if self.latitude is None else (self.latitude, self.longitude, self.radius_km)
+
+# definition du model de donnée pour les feedbacks utilisateurs
+class FeedbackRequest(BaseModel):
+    question : str = Field(description='Question posée par l\'utilisateur', min_length=1, max_length=500)
+    answer: Optional[str] = Field(default=None, description='Réponse générée', max_length=10000)
+    sources: Optional[str] = Field(default=None, description='Sources affichées avec la réponse', max_length=10000)
+    feedback: str = Field(description='positive ou negative', pattern="^(positive|negative)$")
+    comment: Optional[str] = Field(default=None, description='Commentaire optionnel', max_length=2000)
+    model_size: Optional[str] = Field(default=None, description='Modèle ayant produit la réponse', pattern="^(small|large)$")
+    source_ids: List[str] = Field(default_factory=list, description='Identifiants des événements sources', max_length=MAX_SOURCE_IDS)
+    ab_arm: Optional[str] = Field(default=None, description='Groupe A/B de la réponse', pattern="^(control|priors)$")